@@ -1,3 +1,7 @@
 FIG1_LABEL_FONT_SIZE = 19
 FIG1_TICK_FONT_SIZE = 16
-FIG1_TITLE_FONT_SIZE = 20
\ No newline at end of file
+FIG1_TITLE_FONT_SIZE = 20
+
+# Display window of every frame, also used to limit what is loaded from the DB
+FIG1_VOLTAGE_LIM = (.2, .7)  # V
+FIG1_FREQ_LIM = (5.990e9, 6.015e9)  # Hz
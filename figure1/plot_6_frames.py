@@ -1,17 +1,19 @@
 import shared.generate_transmission_plots as gte
+from shared.datasets import ExperimentDataset
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
 
-from figure1.config import FIG1_LABEL_FONT_SIZE, FIG1_TICK_FONT_SIZE, FIG1_TITLE_FONT_SIZE
+from figure1.config import FIG1_LABEL_FONT_SIZE, FIG1_TICK_FONT_SIZE, FIG1_TITLE_FONT_SIZE, FIG1_VOLTAGE_LIM, \
+    FIG1_FREQ_LIM
 from shared.constants import VOLTS_TO_MUT, VEC_B
 
 
 
 
-def generate_frame(ax, engine, experiment_id, title, add_x_label=False, add_y_label=False):
+def generate_frame(ax, pending_data, experiment_id, title, add_x_label=False, add_y_label=False):
     try:
-        # Query the data for the experiment
-        power_grid, voltages, frequencies, settings = gte.__get_data_from_db(engine, experiment_id)
+        # Wait for the experiment's grid, which loads in the background (see main)
+        power_grid, voltages, frequencies, settings = pending_data.result()
 
         print(f"  Voltages shape: {voltages.shape}")
 
@@ -34,8 +36,8 @@ def generate_frame(ax, engine, experiment_id, title, add_x_label=False, add_y_la
 
         ax.tick_params(axis='both', which='major', labelsize=FIG1_TICK_FONT_SIZE)
 
-        ax.set_xlim([.2 * VOLTS_TO_MUT, .7 * VOLTS_TO_MUT])
-        ax.set_ylim([5.990, 6.015])
+        ax.set_xlim([FIG1_VOLTAGE_LIM[0] * VOLTS_TO_MUT, FIG1_VOLTAGE_LIM[1] * VOLTS_TO_MUT])
+        ax.set_ylim([FIG1_FREQ_LIM[0] / 1e9, FIG1_FREQ_LIM[1] / 1e9])
 
     except Exception as e:
         # Gracefully handle errors for individual experiments
@@ -54,6 +56,13 @@ def main():
         "aa0af2fa-4ce0-4573-a30e-796d2461a9d7"  # Last experiment exists in a different database
     ]
 
+    # Each experiment is looked up in whichever database holds it, and all six load concurrently.
+    # Only the part visible in the frames is queried; the six grids stay alive in their meshes until
+    # the figure is saved, so they are kept as float32
+    dataset = ExperimentDataset(['wednesday_overnight', 'thursday_overmorning'], directory='../data')
+    window = gte.__view_window(FIG1_VOLTAGE_LIM, FIG1_FREQ_LIM)
+    pending = [dataset.submit(experiment_id, **window, compact='float32') for experiment_id in experiment_ids]
+
     # Titles for the plots
     phi_labels = ["0", "$\pi$"]
     gamma_labels = [25, 20, 15]
@@ -76,14 +85,10 @@ def main():
         gamma_label = gamma_labels[row]  # Gamma depends on the row
         title = f"$\phi$ = {phi_label}, $\Gamma$ = {gamma_label} dB"
 
-        # Use a different database for the last experiment
-        if idx == len(experiment_ids) - 1:  # Last experiment
-            engine = gte.__get_engine('../data/thursday_overmorning')
-        else:
-            engine = gte.__get_engine('../data/wednesday_overnight')
-
         # Generate the frame with the custom title
-        generate_frame(ax, engine, experiment_id, title, add_x_label=add_x_label, add_y_label=add_y_label)
+        generate_frame(ax, pending[idx], experiment_id, title, add_x_label=add_x_label, add_y_label=add_y_label)
+
+    dataset.close()
 
     plt.tight_layout()
     plt.savefig('figure1.png', dpi=300)
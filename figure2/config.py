@@ -1,6 +1,7 @@
 # config.py
 import matplotlib.pyplot as plt
 from matplotlib import cm
+import os
 import numpy as np
 
 LABEL_FONT_SIZE = 23
@@ -28,6 +29,16 @@ CUTOFF_VOLTAGES = {
 
 VOLTS_TO_MUT = 1428.6
 
+# Theory frames: 'numeric' (closed-form numpy) or 'sympy' (lambdified symbolic model)
+THEORY_BACKEND = 'numeric'
+
+# With THEORY_PEAK_METHOD = 'sampled', theory results are also kept on disk between figure builds;
+# None keeps them in memory only
+THEORY_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', '.theory_cache')
+
+# Theory peaks: 'analytic' (exact stationary points of |S21|^2) or 'sampled' (find_peaks on the LO grid)
+THEORY_PEAK_METHOD = 'analytic'
+
 
 # Other configurations as needed
 
@@ -1,11 +1,13 @@
 # frame_A.py
+from dataclasses import replace
+
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.signal import find_peaks
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
-from theory import dimer_model_symbolics as sm  # Adjust this based on your project structure
+from theory import dimer_model_numeric as nm, peak_positions, response_cache
 from config import LABEL_FONT_SIZE, TICK_FONT_SIZE, INSET_TICK_FONT_SIZE, LEGEND_FONT_SIZE, \
-    INSET_LABEL_FONT_SIZE, set_y_ticks, set_x_ticks  # Assuming a config file for shared settings
+    INSET_LABEL_FONT_SIZE, THEORY_BACKEND, THEORY_CACHE_DIR, THEORY_PEAK_METHOD, \
+    set_y_ticks, set_x_ticks  # Assuming a config file for shared settings
 
 
 def generate(ax_main, ax_theory=None, ax_theory_inset=None):
@@ -18,61 +20,36 @@ def generate(ax_main, ax_theory=None, ax_theory_inset=None):
     # Create inset plot
     ax_inset = inset_axes(ax_main, width="35%", height="35%", loc="upper right")
 
+    # Base parameters; the peaks of each J value are solved exactly, or with THEORY_PEAK_METHOD = 'sampled'
+    # found on the streamed and cached LO grid
+    params = nm.ModelParams(
+        J_val=J_vals[0],
+        g_val=0.025 - 0.04,
+        cavity_freq=6.0,
+        w_y=6.0,
+        gamma_vec=np.array([0.025, 0.025]),
+        drive_vector=np.array([1, 1]),
+        readout_vector=np.array([1, 1]),
+        phi_val=np.pi,
+    )
+
     # Main and inset plot logic
     for idx, J_val in enumerate(J_vals):
-        # Set up symbolic parameters
-        symbols_dict = sm.setup_symbolic_equations()
-        params = sm.ModelParams(
-            J_val=J_val,
-            g_val=0.025 - 0.04,
-            cavity_freq=6.0,
-            w_y=6.0,
-            gamma_vec=np.array([0.025, 0.025]),
-            drive_vector=np.array([1, 1]),
-            readout_vector=np.array([1, 1]),
-            phi_val=np.pi,
-        )
-
-        # Compute photon numbers
-        ss_response_NR = sm.get_steady_state_response_NR(symbols_dict, params)
-        photon_numbers_NR = sm.compute_photon_numbers_NR(ss_response_NR, yig_freqs, lo_freqs)
-
-        # Initialize lists for peaks and splittings
-        peak_yig_freqs, peak_lo_freqs, peak_photon_numbers = [], [], []
-        splitting_yig_freqs, peak_splittings = [], []
-        found_single_peak, single_peak_location = False, None
-
-        # Find peaks for the main plot and track split data
-        for i, yig in enumerate(yig_freqs):
-            photon_numbers_slice = photon_numbers_NR[i, :]
-            peaks, _ = find_peaks(photon_numbers_slice, height=np.max(photon_numbers_slice) * 0.1)
-            peak_lo = lo_freqs[peaks]
-            peak_photons = photon_numbers_slice[peaks]
-
-            if len(peaks) == 1 and not found_single_peak:
-                found_single_peak = True
-                single_peak_location = yig
-            if len(peaks) == 2:
-                splitting = abs(peak_lo[1] - peak_lo[0])
-                splitting_yig_freqs.append(yig)
-                peak_splittings.append(splitting)
-
-            peak_yig_freqs.extend([yig] * len(peaks))
-            peak_lo_freqs.extend(peak_lo)
-            peak_photon_numbers.extend(peak_photons)
-
-        # Filter main plot data up to the single peak location
-        if single_peak_location is not None:
-            peak_yig_freqs_left = np.array(peak_yig_freqs)
-            peak_yig_freqs_left[peak_yig_freqs_left > single_peak_location] = np.nan
-            valid_indices = ~np.isnan(peak_yig_freqs_left)
-            filtered_peak_yig_freqs = peak_yig_freqs_left[valid_indices]
-            filtered_peak_lo_freqs = np.array(peak_lo_freqs)[valid_indices]
-            filtered_peak_photon_numbers = np.array(peak_photon_numbers)[valid_indices]
+        if THEORY_PEAK_METHOD == 'analytic':
+            peaks = peak_positions.analytic_peaks(replace(params, J_val=J_val), 'w_y', yig_freqs,
+                                                  (lo_freqs[0], lo_freqs[-1]))
         else:
-            filtered_peak_yig_freqs = np.array(peak_yig_freqs)
-            filtered_peak_lo_freqs = np.array(peak_lo_freqs)
-            filtered_peak_photon_numbers = np.array(peak_photon_numbers)
+            peak_records = response_cache.cached_photon_numbers(replace(params, J_val=J_val), 'w_y', yig_freqs,
+                                                                lo_freqs, reducer='peaks', backend=THEORY_BACKEND,
+                                                                cache_dir=THEORY_CACHE_DIR)
+            peaks = peak_positions.sampled_peaks(peak_records, yig_freqs, lo_freqs)
+
+        # Keep the rows up to the first single peak
+        single_peak_row = peaks.first_single_peak()
+        last_row = single_peak_row if single_peak_row is not None else yig_freqs.size - 1
+        peak_rows, peak_slots = np.nonzero(~np.isnan(peaks.freqs[:last_row + 1]))
+        filtered_peak_yig_freqs = yig_freqs[peak_rows]
+        filtered_peak_lo_freqs = peaks.freqs[peak_rows, peak_slots]
 
         # Plot the filtered data on the main plot
         ax_main.scatter(
@@ -85,8 +62,9 @@ def generate(ax_main, ax_theory=None, ax_theory_inset=None):
         )
 
         # Filter and plot peak splitting data on the inset
-        splitting_yig_freqs_left = np.array(splitting_yig_freqs)[np.array(splitting_yig_freqs) <= single_peak_location]
-        peak_splittings_left = np.array(peak_splittings)[np.array(splitting_yig_freqs) <= single_peak_location]
+        split_rows = np.flatnonzero(peaks.counts[:last_row + 1] == 2)
+        splitting_yig_freqs_left = yig_freqs[split_rows]
+        peak_splittings_left = peaks.splittings()[split_rows]
         ax_inset.scatter(
             splitting_yig_freqs_left,
             peak_splittings_left,
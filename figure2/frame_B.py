@@ -1,12 +1,14 @@
 # frame_B.py
+from dataclasses import replace
+
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.signal import find_peaks
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
-from theory import dimer_model_symbolics as sm  # Adjust this based on your project structure
+from theory import dimer_model_numeric as nm, peak_positions, response_cache
 from config import LABEL_FONT_SIZE, TICK_FONT_SIZE, \
     LEGEND_FONT_SIZE, INSET_TICK_FONT_SIZE, INSET_LABEL_FONT_SIZE, \
-    NUM_Y_TICKS, set_y_ticks, set_x_ticks  # Assuming you have a config file for shared settings
+    NUM_Y_TICKS, THEORY_BACKEND, THEORY_CACHE_DIR, THEORY_PEAK_METHOD, \
+    set_y_ticks, set_x_ticks  # Assuming you have a config file for shared settings
 
 
 def generate(ax_main, ax_theory=None, ax_theory_inset=None):
@@ -16,61 +18,40 @@ def generate(ax_main, ax_theory=None, ax_theory_inset=None):
     gamma_y_vals = np.linspace(0.15, 0.3, 1000)  # PT parameter sweep
     colors = ['green', 'b', 'purple', 'r']
 
-    # Main plot logic for each J value
+    # Base parameters; the peaks of each J value are solved exactly, or with THEORY_PEAK_METHOD = 'sampled'
+    # found on the streamed and cached LO grid
+    params = nm.ModelParams(
+        J_val=J_vals[0],
+        g_val=0.025 - 0.04,
+        cavity_freq=6.0,
+        w_y=6.0,
+        gamma_vec=np.array([0.04, 0.04]),
+        drive_vector=np.array([1, 0]),
+        readout_vector=np.array([1, 0]),
+        phi_val=0,
+    )
+
+    # Main plot logic for each J value; the inset reuses the splittings
+    inset_data = []
     for idx, J_val in enumerate(J_vals):
-        symbols_dict = sm.setup_symbolic_equations()
-        params = sm.ModelParams(
-            J_val=J_val,
-            g_val=0.025 - 0.04,
-            cavity_freq=6.0,
-            w_y=6.0,
-            gamma_vec=np.array([0.04, 0.04]),
-            drive_vector=np.array([1, 0]),
-            readout_vector=np.array([1, 0]),
-            phi_val=0,
-        )
-
-        # Compute photon numbers
-        ss_response_PT = sm.get_steady_state_response_PT(symbols_dict, params)
-        photon_numbers_PT = sm.compute_photon_numbers_PT(ss_response_PT, gamma_y_vals, lo_freqs)
-
-        # Initialize lists for peaks and splittings
-        peak_gamma_y, peak_lo_freqs, peak_photon_numbers = [], [], []
-        splitting_gamma_y_vals, peak_splittings = [], []
-        found_single_peak = False
-        single_peak_location = None
-
-        # Find peaks for main plot and split tracking
-        for i, gam in enumerate(gamma_y_vals):
-            photon_numbers_slice = photon_numbers_PT[i, :]
-            peaks, _ = find_peaks(photon_numbers_slice, height=np.max(photon_numbers_slice) * 0.1)
-            peak_lo = lo_freqs[peaks]
-            peak_photons = photon_numbers_slice[peaks]
-
-            if len(peaks) == 1 and not found_single_peak:
-                found_single_peak = True
-                single_peak_location = gam
-            if len(peaks) == 2:
-                splitting = abs(peak_lo[1] - peak_lo[0])
-                splitting_gamma_y_vals.append(gam)
-                peak_splittings.append(splitting)
-
-            peak_gamma_y.extend([gam] * len(peaks))
-            peak_lo_freqs.extend(peak_lo)
-            peak_photon_numbers.extend(peak_photons)
-
-        # Filter data up to the single peak location for the main plot
-        if single_peak_location is not None:
-            peak_gamma_y_left_of_single_peak = np.array(peak_gamma_y)
-            peak_gamma_y_left_of_single_peak[peak_gamma_y_left_of_single_peak > single_peak_location] = np.nan
-            valid_indices = ~np.isnan(peak_gamma_y_left_of_single_peak)
-            filtered_peak_gamma_y = peak_gamma_y_left_of_single_peak[valid_indices]
-            filtered_peak_lo_freqs = np.array(peak_lo_freqs)[valid_indices]
-            filtered_peak_photon_numbers = np.array(peak_photon_numbers)[valid_indices]
+        if THEORY_PEAK_METHOD == 'analytic':
+            peaks = peak_positions.analytic_peaks(replace(params, J_val=J_val), 'gam_y', gamma_y_vals,
+                                                  (lo_freqs[0], lo_freqs[-1]))
         else:
-            filtered_peak_gamma_y = np.array(peak_gamma_y)
-            filtered_peak_lo_freqs = np.array(peak_lo_freqs)
-            filtered_peak_photon_numbers = np.array(peak_photon_numbers)
+            peak_records = response_cache.cached_photon_numbers(replace(params, J_val=J_val), 'gam_y', gamma_y_vals,
+                                                                lo_freqs, reducer='peaks', backend=THEORY_BACKEND,
+                                                                cache_dir=THEORY_CACHE_DIR)
+            peaks = peak_positions.sampled_peaks(peak_records, gamma_y_vals, lo_freqs)
+
+        # Keep the rows up to the first single peak
+        single_peak_row = peaks.first_single_peak()
+        last_row = single_peak_row if single_peak_row is not None else gamma_y_vals.size - 1
+        peak_rows, peak_slots = np.nonzero(~np.isnan(peaks.freqs[:last_row + 1]))
+        filtered_peak_gamma_y = gamma_y_vals[peak_rows]
+        filtered_peak_lo_freqs = peaks.freqs[peak_rows, peak_slots]
+
+        split_rows = np.flatnonzero(peaks.counts[:last_row + 1] == 2)
+        inset_data.append((gamma_y_vals[split_rows], peaks.splittings()[split_rows]))
 
         # Plot the filtered data on the main plot
         ax_main.scatter(
@@ -96,52 +77,7 @@ def generate(ax_main, ax_theory=None, ax_theory_inset=None):
     ax_inset.invert_xaxis()
 
     # Plot peak splitting data on the inset
-    for idx, J_val in enumerate(J_vals):
-        symbols_dict = sm.setup_symbolic_equations()
-        params = sm.ModelParams(
-            J_val=J_val,
-            g_val=0.025 - 0.04,
-            cavity_freq=6.0,
-            w_y=6.0,
-            gamma_vec=np.array([0.04, 0.04]),
-            drive_vector=np.array([1, 0]),
-            readout_vector=np.array([1, 0]),
-            phi_val=0,
-        )
-
-        # Recompute photon numbers for inset plot
-        ss_response_PT = sm.get_steady_state_response_PT(symbols_dict, params)
-        photon_numbers_PT = sm.compute_photon_numbers_PT(ss_response_PT, gamma_y_vals, lo_freqs)
-
-        splitting_gamma_y_vals, peak_splittings = [], []
-        found_single_peak = False
-        single_peak_location = None
-
-        # Track peak splitting for each gamma_y
-        for i, gam in enumerate(gamma_y_vals):
-            photon_numbers_slice = photon_numbers_PT[i, :]
-            peaks, _ = find_peaks(photon_numbers_slice, height=np.max(photon_numbers_slice) * 0.1)
-            peak_lo = lo_freqs[peaks]
-
-            if len(peaks) == 1 and not found_single_peak:
-                found_single_peak = True
-                single_peak_location = gam
-
-            if len(peaks) == 2:
-                splitting = abs(peak_lo[1] - peak_lo[0])
-                splitting_gamma_y_vals.append(gam)
-                peak_splittings.append(splitting)
-
-        # Filter splitting data for the inset plot
-        if single_peak_location is not None:
-            splitting_gamma_y_left = np.array(splitting_gamma_y_vals)[
-                np.array(splitting_gamma_y_vals) <= single_peak_location]
-            peak_splittings_left = np.array(peak_splittings)[np.array(splitting_gamma_y_vals) <= single_peak_location]
-        else:
-            splitting_gamma_y_left = np.array(splitting_gamma_y_vals)
-            peak_splittings_left = np.array(peak_splittings)
-
-        # Plot each trace on the inset
+    for idx, (J_val, (splitting_gamma_y_left, peak_splittings_left)) in enumerate(zip(J_vals, inset_data)):
         ax_inset.scatter(
             splitting_gamma_y_left,
             peak_splittings_left,
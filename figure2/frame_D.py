@@ -1,17 +1,23 @@
 # frame_C.py
+import contextlib
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
-from sqlalchemy import create_engine
 from scipy.signal import find_peaks
 from config import LABEL_FONT_SIZE, TICK_FONT_SIZE, LEGEND_FONT_SIZE, \
     INSET_TICK_FONT_SIZE, INSET_LABEL_FONT_SIZE, set_y_ticks, set_x_ticks  # Assuming config file for shared settings
 import matplotlib.ticker as mticker
 from matplotlib.colors import ListedColormap
 
+from shared.branches import adjacent_differences
+from shared.datasets import ExperimentDataset
+from shared.grids import build_grid
+from shared.peaks import find_peaks_2d, find_peaks_many, peak_pool, peaks_to_frame
+
 TABLE_NAME = 'expr'
 
+DEFAULT_PEAK_KWARGS = dict(height=-7, prominence=0.037, distance=10)
+
 # Thresholds mapping based on loop attenuation
 attenuation_thresholds = {
     17.0: 15.9,
@@ -24,37 +30,45 @@ attenuation_thresholds = {
 
 
 # Helper functions
-def __get_engine(db_name):
-    return create_engine(f'sqlite:///../data/{db_name}.db')
-
-
 def __get_data_from_db(engine, experiment_id, freq_min=1e9, freq_max=99e9):
+    # The unary + keeps SQLite from serving the frequency range with a frequency-led index, which would
+    # leave the attenuation order to a sort; the attenuation index covers the query in order instead
     data_query = f"""
     SELECT frequency_hz, set_cavity_fb_att, power_dBm FROM {TABLE_NAME}
     WHERE experiment_id = '{experiment_id}'
-    AND frequency_hz BETWEEN {freq_min} AND {freq_max}
+    AND +frequency_hz BETWEEN {freq_min} AND {freq_max}
     ORDER BY set_cavity_fb_att, frequency_hz
     """
     data = pd.read_sql_query(data_query, engine)
     if not data.empty:
-        pivot_table = data.pivot_table(index='set_cavity_fb_att', columns='frequency_hz', values='power_dBm',
-                                       aggfunc='first')
-        attenuations = pivot_table.index.values
-        frequencies = pivot_table.columns.values
-        power_grid = pivot_table.values
+        power_grid, attenuations, frequencies = build_grid(data['set_cavity_fb_att'], data['frequency_hz'],
+                                                           data['power_dBm'])
         return power_grid, attenuations, frequencies
     else:
         return None, None, None
 
 
+def __load_experiment(engine, experiment_id):
+    power_grid, attenuations, frequencies = __get_data_from_db(engine, experiment_id)
+    settings = pd.read_sql_query(
+        f"SELECT set_loop_phase_deg, set_loop_att, set_loopback_att, set_yig_fb_phase_deg, set_voltage, set_yig_fb_att FROM {TABLE_NAME} WHERE experiment_id = '{experiment_id}'",
+        engine).iloc[0]
+    return power_grid, attenuations, frequencies, settings
+
+
 def __default_peak_finding_function(frequencies, powers):
-    peaks_indices, properties = find_peaks(powers, height=-7, prominence=0.037, distance=10)
+    peaks_indices, properties = find_peaks(powers, **DEFAULT_PEAK_KWARGS)
     peak_freqs = frequencies[peaks_indices]
     peak_powers = powers[peaks_indices]
     return peak_freqs, peak_powers
 
 
 def __process_all_traces(power_grid, attenuations, frequencies, peak_finding_function=__default_peak_finding_function):
+    if peak_finding_function is __default_peak_finding_function:
+        # Whole grid in one pass; same peaks as the per-row loop below, and faster (python -m shared.bench_peaks)
+        peaks = find_peaks_2d(power_grid, **DEFAULT_PEAK_KWARGS)
+        return peaks_to_frame(peaks, attenuations, frequencies, 'attenuation')
+
     attenuations_list = []
     peak_freqs_list = []
     peak_powers_list = []
@@ -69,29 +83,67 @@ def __process_all_traces(power_grid, attenuations, frequencies, peak_finding_fun
     return peaks_df
 
 
+def __compute_splittings(all_peaks):
+    """
+    Adjacent peak-frequency differences within every (database, attenuation) group, in one pass.
+    Returns a DataFrame of database, attenuation and splitting [Hz].
+    """
+    if all_peaks.empty:
+        return pd.DataFrame(columns=['database', 'attenuation', 'splitting'])
+    lower, diffs = adjacent_differences([all_peaks['database'].to_numpy(), all_peaks['attenuation'].to_numpy()],
+                                        all_peaks['peak_freq'].to_numpy())
+    splittings = all_peaks[['database', 'attenuation']].iloc[lower].reset_index(drop=True)
+    splittings['splitting'] = diffs
+    return splittings
+
+
+def __find_batch_peaks(batch, pool=None):
+    """
+    Peaks of a batch [(db_name, (power_grid, attenuations, frequencies, settings))], one experiment per
+    pool task when a pool is given. Returns [(db_name, peaks_df, attenuations, settings)].
+    """
+    if pool is None:
+        peaks_dfs = [__process_all_traces(power_grid, attenuations, frequencies)
+                     for _, (power_grid, attenuations, frequencies, _) in batch]
+    else:
+        # The workers read the grids from shared memory
+        grid_peaks = find_peaks_many([power_grid for _, (power_grid, *_) in batch], pool, **DEFAULT_PEAK_KWARGS)
+        peaks_dfs = [peaks_to_frame(peaks, attenuations, frequencies, 'attenuation')
+                     for peaks, (_, (_, attenuations, frequencies, _)) in zip(grid_peaks, batch)]
+    return [(db_name, peaks_df, attenuations, settings)
+            for peaks_df, (db_name, (_, attenuations, _, settings)) in zip(peaks_dfs, batch)]
+
+
 # Main function to generate Frame C
-def generate(ax):
+def generate(ax, jobs=1):
     # Load data
     dbs = ['loop_14.5_dB_1', 'loop_15.5_dB_1', 'loop_16.5_dB_1', 'loop_17_dB_1']
     all_peaks = pd.DataFrame()
     colors = {'loop_14.5_dB_1': 'crimson', 'loop_15.5_dB_1': '#483D8B', 'loop_16.5_dB_1': 'royalblue',
               'loop_17_dB_1': 'forestgreen'}
 
-    for db_name in dbs:
-        engine = __get_engine(db_name)
-        experiment_ids = pd.read_sql_query(f'SELECT DISTINCT experiment_id FROM {TABLE_NAME}', engine)
-        for experiment_id in experiment_ids['experiment_id']:
-            power_grid, attenuations, frequencies = __get_data_from_db(engine, experiment_id)
-            if power_grid is not None:
-                peaks_df = __process_all_traces(power_grid, attenuations, frequencies)
-                settings = pd.read_sql_query(
-                    f"SELECT set_loop_phase_deg, set_loop_att, set_loopback_att, set_yig_fb_phase_deg, set_voltage, set_yig_fb_att FROM {TABLE_NAME} WHERE experiment_id = '{experiment_id}'",
-                    engine).iloc[0]
-                loop_att = settings['set_loop_att']
-                threshold = attenuation_thresholds.get(loop_att, max(attenuations))
-                filtered_peaks_df = peaks_df[peaks_df['attenuation'] > threshold].copy()
-                filtered_peaks_df['database'] = db_name
-                all_peaks = pd.concat([all_peaks, filtered_peaks_df], ignore_index=True)
+    # The four databases are read concurrently and every experiment is reduced to its peaks as it
+    # arrives, so only the grids in flight are held in memory
+    found = []
+    with ExperimentDataset(dbs, directory='../data') as dataset, \
+            (peak_pool(jobs) if jobs > 1 else contextlib.nullcontext()) as pool:
+        batch = []
+        for db_name, _, loaded in dataset.iter_all(__load_experiment):
+            # Experiments without data in the frequency window come back as (None, None, None, settings)
+            if loaded[0] is None:
+                continue
+            batch.append((db_name, loaded))
+            if len(batch) >= jobs:
+                found.extend(__find_batch_peaks(batch, pool))
+                batch = []
+        found.extend(__find_batch_peaks(batch, pool))
+
+    for db_name, peaks_df, attenuations, settings in found:
+        loop_att = settings['set_loop_att']
+        threshold = attenuation_thresholds.get(loop_att, max(attenuations))
+        filtered_peaks_df = peaks_df[peaks_df['attenuation'] > threshold].copy()
+        filtered_peaks_df['database'] = db_name
+        all_peaks = pd.concat([all_peaks, filtered_peaks_df], ignore_index=True)
 
     # Format for labels
     def format_label(db_name):
@@ -113,19 +165,10 @@ def generate(ax):
     # Inset Plot (Frequency Differences)
     inset_ax = inset_axes(ax, width="35%", height="35%", loc="upper left", bbox_to_anchor=(.01, 0, 1, 1),
                           bbox_transform=ax.transAxes)
-    legend_labels = set()
-    for name, group in all_peaks.groupby('database'):
-        group = group.sort_values(by='attenuation')
-        grouped = group.groupby('attenuation')
-        for attenuation, group_att in grouped:
-            freqs = sorted(group_att['peak_freq'])
-            diffs = [freqs[i + 1] - freqs[i] for i in range(len(freqs) - 1)]
-            if diffs:
-                label = format_label(name) if name not in legend_labels else None
-                inset_ax.scatter([attenuation] * len(diffs), np.array(diffs) / 1e6, s=15, color=colors[name],
-                                 label=label)
-                if label:
-                    legend_labels.add(name)
+    # One scatter per database instead of one per attenuation
+    for name, group in __compute_splittings(all_peaks).groupby('database'):
+        inset_ax.scatter(group['attenuation'], group['splitting'] / 1e6, s=15, color=colors[name],
+                         label=format_label(name))
     # inset_ax.set_xlabel('$\Gamma_c$ [dB]', fontsize=LABEL_FONT_SIZE - 4)
     # inset_ax.set_ylabel('Frequency Splitting [MHz]', fontsize=LABEL_FONT_SIZE - 4)
     # inset_ax.axvline(x=14.1, color='black', linestyle='--', lw=2.0, alpha=0.5)
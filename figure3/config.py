@@ -6,6 +6,12 @@ EP_LINE_COLOR = 'lime'
 UPPER_BRANCH_FREQ_LINE = 6.02e9
 UPPER_BRANCH_LINE_COLOR = 'forestgreen'
 
+# Readout window shown by the color plot
+VIEW_FREQ_LIM = (5.997e9, 6.033e9)  # Hz
+# The peak search reads this many view spans beyond each side of VIEW_FREQ_LIM, so the prominence of every
+# displayed peak is measured against its surroundings rather than against the window edge
+PEAK_SEARCH_MARGIN = 1.0
+
 LABEL_FONT_SIZE = 23
 TICK_FONT_SIZE = 20
 
@@ -4,13 +4,16 @@ from matplotlib import gridspec
 from frame_one_derivative import generate as generate_frame_one_derivative
 from frame_upper_branch_derivative import generate as generate_frame_upper_branch_derivative
 
+from figure3.config import VIEW_FREQ_LIM
 from shared import generate_transmission_plots as gte
 
 
 def main():
     experiment_id = '413b3b49-c536-427f-a0fd-f0859052f0bd'
     engine = gte.__get_engine('../data/overweekend_loop_phase_search')
-    power_grid, voltages, frequencies, settings = gte.__get_data_from_db(engine, experiment_id)
+    # Only the FREQ_LINE and UPPER_BRANCH_FREQ_LINE columns are read, so the displayed window is enough
+    power_grid, voltages, frequencies, settings = gte.__get_data_from_db(
+        engine, experiment_id, **gte.__view_window(freq_lim=VIEW_FREQ_LIM))
 
     fig = plt.figure(figsize=(20, 8))
     gs = gridspec.GridSpec(1, 2)
@@ -1,27 +1,31 @@
+import contextlib
 import pandas as pd
-from sqlalchemy import create_engine
 import matplotlib.pyplot as plt
 import os
 import numpy as np
 from scipy.signal import find_peaks
 
+from shared import generate_transmission_plots as gte
+from shared.grids import build_grid, compact_grid
+from shared.peaks import find_peaks_2d, find_peaks_many, peak_pool, peaks_to_frame
+from shared.prefetch import prefetch
+
 TABLE_NAME = 'expr'
 
 LABEL_FONT_SIZE = 19
 TICK_FONT_SIZE = 15
 SAVE_DPI = 400
 
+DEFAULT_PEAK_KWARGS = dict(height=-7, prominence=0.025, distance=10)
+
 
 ####
 # SETTINGS
 ####
 
 
-def __get_engine(db_name):
-    return create_engine(f'sqlite:///{db_name}.db')
-
-
-def __get_data_from_db(engine, experiment_id, freq_min=1e9, freq_max=99e9, voltage_min=-2.0, voltage_max=2.0):
+def __get_data_from_db(engine, experiment_id, freq_min=1e9, freq_max=99e9, voltage_min=-2.0, voltage_max=2.0,
+                       compact=None):
     # Query the apparatus settings for the experiment
     settings_query = f"""
     SELECT DISTINCT set_loop_phase_deg, set_loop_att, set_loopback_att,
@@ -42,23 +46,29 @@ def __get_data_from_db(engine, experiment_id, freq_min=1e9, freq_max=99e9, volta
     """
     data = pd.read_sql_query(data_query, engine)
 
-    pivot_table = data.pivot_table(index='set_voltage', columns='frequency_hz', values='power_dBm', aggfunc='first')
-
-    frequencies = pivot_table.columns.values
-    voltages = pivot_table.index.values
-    power_grid = pivot_table.values
+    power_grid, voltages, frequencies = build_grid(data['set_voltage'], data['frequency_hz'], data['power_dBm'])
 
-    return power_grid, voltages, frequencies, settings
+    return compact_grid(power_grid, compact), voltages, frequencies, settings
 
 
 def __default_peak_finding_function(frequencies, powers):
-    peaks_indices, properties = find_peaks(powers, height=-7, prominence=0.025, distance=10)
+    peaks_indices, properties = find_peaks(powers, **DEFAULT_PEAK_KWARGS)
     peak_freqs = frequencies[peaks_indices]
     peak_powers = powers[peaks_indices]
     return peak_freqs, peak_powers
 
 
-def __process_all_traces(power_grid, voltages, frequencies, peak_finding_function=__default_peak_finding_function):
+def __process_all_traces(power_grid, voltages, frequencies, peak_finding_function=__default_peak_finding_function,
+                         pool=None, jobs=1):
+    if peak_finding_function is __default_peak_finding_function:
+        # Whole grid in one pass; same peaks as the per-row loop below, and faster (python -m shared.bench_peaks)
+        if pool is None:
+            peaks = find_peaks_2d(power_grid, **DEFAULT_PEAK_KWARGS)
+        else:
+            # Row blocks of the grid go to the pool's workers through shared memory
+            peaks, = find_peaks_many([power_grid], pool, chunks=jobs, **DEFAULT_PEAK_KWARGS)
+        return peaks_to_frame(peaks, voltages, frequencies, 'voltage')
+
     voltages_list = []
     peak_freqs_list = []
     peak_powers_list = []
@@ -160,34 +170,43 @@ def __save_derivative_plot_to_file(fig, db_name, experiment_id):
 
 def plot_all_experiments(db_name, freq_min=1e9, freq_max=99e9, voltage_min=-2.0, voltage_max=2.0,
                          vmin_transmission=-40, vmax_transmission=None,
-                         vmin_derivative=0, vmax_derivative=None):
-    engine = __get_engine(db_name)
-    experiment_ids = pd.read_sql_query(f'SELECT DISTINCT experiment_id FROM {TABLE_NAME}', engine)
-
-    for experiment_id in experiment_ids['experiment_id']:
-        print(f'Plotting experiment {experiment_id}...')
-        power_grid, voltages, frequencies, settings = __get_data_from_db(
-            engine, experiment_id, freq_min, freq_max, voltage_min, voltage_max)
-
-        # Process all traces to find peaks
-        peaks_df = __process_all_traces(power_grid, voltages, frequencies)
-
-        # Generate transmission plot
-        fig = __generate_transmission_plot(power_grid, voltages, frequencies, peaks_df, experiment_id, settings,
-                                           vmin=vmin_transmission, vmax=vmax_transmission)
-        __save_plot_to_file(fig, db_name, experiment_id)
-
-        # Generate derivative plot with peak positions
-        fig_derivative = __generate_derivative_plot(power_grid, voltages, frequencies, peaks_df,
-                                                    experiment_id, settings,
-                                                    vmin=vmin_derivative, vmax=vmax_derivative)
-        __save_derivative_plot_to_file(fig_derivative, db_name, experiment_id)
+                         vmin_derivative=0, vmax_derivative=None, bulk=False,
+                         prefetch_depth=0, jobs=1):
+    engine = gte.__get_engine(db_name)
+    if bulk:
+        # One scan of the table for all experiments instead of two queries per experiment
+        experiments = gte.__iter_experiments(engine, freq_min, freq_max, voltage_min, voltage_max)
+    else:
+        experiment_ids = pd.read_sql_query(f'SELECT DISTINCT experiment_id FROM {TABLE_NAME}', engine)
+        experiments = ((experiment_id, *__get_data_from_db(engine, experiment_id, freq_min, freq_max,
+                                                           voltage_min, voltage_max))
+                       for experiment_id in experiment_ids['experiment_id'])
+
+    # With prefetch_depth > 0 the next experiments load on a background thread while this one renders
+    # With jobs > 1 the peak search of each grid is split across a process pool
+    with peak_pool(jobs) if jobs > 1 else contextlib.nullcontext() as pool:
+        for experiment_id, power_grid, voltages, frequencies, settings in prefetch(experiments, prefetch_depth):
+            print(f'Plotting experiment {experiment_id}...')
+
+            # Process all traces to find peaks
+            peaks_df = __process_all_traces(power_grid, voltages, frequencies, pool=pool, jobs=jobs)
+
+            # Generate transmission plot
+            fig = __generate_transmission_plot(power_grid, voltages, frequencies, peaks_df, experiment_id, settings,
+                                               vmin=vmin_transmission, vmax=vmax_transmission)
+            __save_plot_to_file(fig, db_name, experiment_id)
+
+            # Generate derivative plot with peak positions
+            fig_derivative = __generate_derivative_plot(power_grid, voltages, frequencies, peaks_df,
+                                                        experiment_id, settings,
+                                                        vmin=vmin_derivative, vmax=vmax_derivative)
+            __save_derivative_plot_to_file(fig_derivative, db_name, experiment_id)
 
 
 def plot_experiment(experiment_id, db_name, freq_min=1e9, freq_max=5e9, voltage_min=-2.0, voltage_max=2.0,
                     vmin_transmission=-40, vmax_transmission=8,
                     vmin_derivative=0, vmax_derivative=None):
-    engine = __get_engine(db_name)
+    engine = gte.__get_engine(db_name)
     power_grid, voltages, frequencies, settings = __get_data_from_db(
         engine, experiment_id, freq_min, freq_max, voltage_min, voltage_max)
 
@@ -56,7 +56,8 @@ if __name__ == "__main__":
     import shared.generate_transmission_plots as gte
     experiment_id = '413b3b49-c536-427f-a0fd-f0859052f0bd'  # Set the experiment ID
     engine = gte.__get_engine('../data/overweekend_loop_phase_search')  # Ensure correct database name and engine creation
-    power_grid, voltages, frequencies, settings = gte.__get_data_from_db(engine, experiment_id)
+    power_grid, voltages, frequencies, settings = gte.__get_data_from_db(engine, experiment_id, freq_min, freq_max,
+                                                                         voltage_min, voltage_max)
 
     fig, ax_main = plt.subplots(figsize=(10, 6))
     generate(ax_main, power_grid, voltages, frequencies)
@@ -4,7 +4,7 @@ from matplotlib import cm
 from shared import generate_transmission_plots as gte
 import derivative_plots_with_sqrt_ontop as dgte
 from figure3.config import FREQ_LINE, FREQ_LINE_COLOR, EP_LINE_COLOR, VOLTAGE_LINE, INSET_LABEL_FONT_SIZE, VOLTS_TO_MUT, \
- UPPER_BRANCH_FREQ_LINE, UPPER_BRANCH_LINE_COLOR
+ UPPER_BRANCH_FREQ_LINE, UPPER_BRANCH_LINE_COLOR, VIEW_FREQ_LIM, PEAK_SEARCH_MARGIN
 
 from matplotlib.path import Path
 
@@ -45,9 +45,11 @@ def generate(ax_main, power_grid, voltages, frequencies):
     peaks_df = dgte.__process_all_traces(power_grid, voltages, frequencies)
     filtered_peaks_df = peaks_df[(peaks_df['peak_freq'] > FREQ_LINE) & (peaks_df['voltage'] <= 0.25)]
 
-    # Main transmission plot
-    c = ax_main.pcolormesh(voltages * VOLTS_TO_MUT, frequencies / 1e9, power_grid.T, shading='auto', cmap='inferno',
-                           vmin=-40, vmax=8)
+    # Main transmission plot; the peaks above come from the full rows, only the mesh is cut to the visible window
+    window = gte.__view_window(freq_lim=VIEW_FREQ_LIM)
+    shown = (frequencies >= window['freq_min']) & (frequencies <= window['freq_max'])
+    c = ax_main.pcolormesh(voltages * VOLTS_TO_MUT, frequencies[shown] / 1e9, power_grid[:, shown].T, shading='auto',
+                           cmap='inferno', vmin=-40, vmax=8)
 
     # Main colorbar placed to the right of the main plot
     cbar = plt.colorbar(c, ax=ax_main, orientation="vertical", pad=0.02, aspect=30)
@@ -55,7 +57,7 @@ def generate(ax_main, power_grid, voltages, frequencies):
     cbar.ax.tick_params(labelsize=TICK_FONT_SIZE)
 
     # Set axis limits and labels for main plot
-    ax_main.set_ylim(5.997, 6.033)
+    ax_main.set_ylim(VIEW_FREQ_LIM[0] / 1e9, VIEW_FREQ_LIM[1] / 1e9)
     ax_main.set_xlabel('$\Delta$' + VEC_B + '[$\mu$T]', fontsize=LABEL_FONT_SIZE + 4)
     ax_main.set_ylabel('Frequency [GHz]', fontsize=LABEL_FONT_SIZE + 4)
     ax_main.tick_params(axis='x', labelsize=TICK_FONT_SIZE)
@@ -132,7 +134,9 @@ def generate(ax_main, power_grid, voltages, frequencies):
 if __name__ == "__main__":
     experiment_id = '413b3b49-c536-427f-a0fd-f0859052f0bd'
     engine = gte.__get_engine('../data/overweekend_loop_phase_search')
-    power_grid, voltages, frequencies, settings = gte.__get_data_from_db(engine, experiment_id)
+    # The color plot finds its peaks on these rows, so they reach well beyond the displayed window
+    power_grid, voltages, frequencies, settings = gte.__get_data_from_db(
+        engine, experiment_id, **gte.__view_window(freq_lim=VIEW_FREQ_LIM, margin=PEAK_SEARCH_MARGIN))
     fig, ax_main = plt.subplots(figsize=(20, 8))
     generate(ax_main, power_grid, voltages, frequencies)
     plt.tight_layout()
@@ -1,5 +1,5 @@
 import matplotlib.pyplot as plt
-from figure3.config import SAVE_DPI
+from figure3.config import SAVE_DPI, VIEW_FREQ_LIM, PEAK_SEARCH_MARGIN
 from frame_one_derivative import generate as generate_frame_one_derivative
 from frame_colorplot import generate as generate_frame_colorplot
 from shared import generate_transmission_plots as gte
@@ -26,7 +26,9 @@ def main():
     # Set the experiment ID and load data
     experiment_id = '413b3b49-c536-427f-a0fd-f0859052f0bd'
     engine = gte.__get_engine('../data/overweekend_loop_phase_search')
-    power_grid, voltages, frequencies, settings = gte.__get_data_from_db(engine, experiment_id)
+    # The color plot finds its peaks on these rows, so they reach well beyond the displayed window
+    power_grid, voltages, frequencies, settings = gte.__get_data_from_db(
+        engine, experiment_id, **gte.__view_window(freq_lim=VIEW_FREQ_LIM, margin=PEAK_SEARCH_MARGIN))
 
     # Plot the color plot only
     plot_colorplot_only(power_grid, voltages, frequencies)
@@ -0,0 +1,58 @@
+"""
+Compares the pandas and numpy fetch paths of __get_data_from_db on one experiment.
+
+Each run happens in a fresh process so its peak RSS is not inflated by earlier runs:
+
+    python -m shared.bench_fetch ../data/overweekend_loop_phase_search 413b3b49-c536-427f-a0fd-f0859052f0bd
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+
+FETCH_MODES = ['pandas', 'numpy']
+
+
+def __peak_rss_mib():
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def __run(db_name, experiment_id, fetch, results):
+    import shared.generate_transmission_plots as gte
+
+    engine = gte.__get_engine(db_name)
+    rss_before = __peak_rss_mib()
+    start = time.perf_counter()
+    power_grid, voltages, frequencies, settings = gte.__get_data_from_db(engine, experiment_id, use_cache=False,
+                                                                         fetch=fetch)
+    elapsed = time.perf_counter() - start
+    results.put((fetch, elapsed, __peak_rss_mib() - rss_before, power_grid, voltages, frequencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pandas and numpy fetch paths.')
+    parser.add_argument('db_name', help='database path without the .db suffix, as passed to __get_engine')
+    parser.add_argument('experiment_id')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    outputs = {}
+    print(f'{"fetch":<8} {"wall [s]":>10} {"peak RSS growth [MiB]":>24}')
+    for fetch in FETCH_MODES:
+        process = context.Process(target=__run, args=(args.db_name, args.experiment_id, fetch, results))
+        process.start()
+        fetch, elapsed, rss_growth, *grid = results.get()
+        process.join()
+        outputs[fetch] = grid
+        print(f'{fetch:<8} {elapsed:>10.3f} {rss_growth:>24.1f}')
+
+    identical = all(np.array_equal(a, b, equal_nan=True) for a, b in zip(outputs['pandas'], outputs['numpy']))
+    print(f'Outputs identical: {identical}')
+
+
+if __name__ == "__main__":
+    main()
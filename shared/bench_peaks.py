@@ -0,0 +1,69 @@
+"""
+Compares find_peaks_2d with the per-row find_peaks loop of the figure scripts on a synthetic noisy grid:
+two Lorentzian resonances per row sweeping across the band, on a -10 dB floor with Gaussian noise, so
+most rows hold noise maxima closer together than `distance`:
+
+    python -m shared.bench_peaks
+    python -m shared.bench_peaks --rows 2000 --cols 5000 --noise 0.05 --repeat 5
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy.signal import find_peaks
+
+from shared.peaks import find_peaks_2d
+
+# figure3/derivative_plots_with_sqrt_ontop.py's peak settings
+PEAK_KWARGS = dict(height=-7, prominence=0.025, distance=10)
+
+
+def noisy_lorentzian_grid(n_rows, n_cols, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = np.arange(n_cols)
+    sweep = np.linspace(-1, 1, n_rows)[:, None]
+    centers = n_cols / 2 + np.array([-1, 1]) * n_cols * (0.05 + 0.2 * np.sqrt(np.abs(sweep)))
+    width = n_cols / 200
+    lorentzians = 1 / (1 + ((columns - centers[..., None]) / width) ** 2)
+    return lorentzians.sum(axis=1) * 10 - 10 + rng.normal(scale=noise, size=(n_rows, n_cols))
+
+
+def __per_row(grid):
+    return [find_peaks(row, **PEAK_KWARGS)[0] for row in grid]
+
+
+def __best_of(function, grid, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(grid)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark find_peaks_2d against the per-row loop.')
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--cols', type=int, default=5000)
+    parser.add_argument('--noise', type=float, default=0.05, help='noise standard deviation [dB]')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    grid = noisy_lorentzian_grid(args.rows, args.cols, args.noise)
+    per_row_time, per_row = __best_of(__per_row, grid, args.repeat)
+    batch_time, batch = __best_of(lambda g: find_peaks_2d(g, **PEAK_KWARGS), grid, args.repeat)
+
+    candidates = [find_peaks(row, height=PEAK_KWARGS['height'])[0] for row in grid]
+    conflicted = sum((np.diff(found) < PEAK_KWARGS['distance']).any() for found in candidates)
+    print(f'{args.rows} x {args.cols} grid, noise {args.noise} dB, {conflicted} rows with peaks closer than distance')
+    print(f'{"method":<14} {"wall [s]":>10}')
+    print(f'{"per-row":<14} {per_row_time:>10.3f}')
+    print(f'{"find_peaks_2d":<14} {batch_time:>10.3f}')
+
+    rows = np.repeat(np.arange(args.rows), [found.size for found in per_row])
+    identical = np.array_equal(batch['row'], rows) and np.array_equal(batch['col'], np.concatenate(per_row))
+    print(f'Outputs identical: {identical}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Links the peaks of a swept power grid into branches.
+
+Peaks are chained into continuous tracks by nearest-neighbour assignment to the previous rows (voltage
+or attenuation), tolerating up to max_gap rows in which a track has no peak. The two longest tracks
+are the branches: the one with the lower mean frequency is LOWER, the other UPPER, and every other
+peak is OTHER. A row where one branch was missed therefore keeps the label of the peak it has.
+Where one branch ends and the other continues through a peak lying between them, the branches have
+coalesced, and the continuing peaks beyond that row are MERGED.
+
+    branches = track_branches(peaks_df, 'voltage')
+    upper = branches.upper()
+    rows, splittings = branches.splittings()
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Branch labels
+OTHER, LOWER, UPPER, MERGED = -1, 0, 1, 2
+BRANCH_NAMES = {OTHER: 'other', LOWER: 'lower', UPPER: 'upper', MERGED: 'merged'}
+
+
+def adjacent_differences(group_keys, values):
+    """
+    Differences between neighbouring sorted values within each group, for all groups in one pass.
+    group_keys is one key array or a list of them (sorted lexicographically, first key first).
+    Returns (index of the lower value of each pair, difference), ordered by group then value.
+    """
+    keys = [np.asarray(key) for key in (group_keys if isinstance(group_keys, (list, tuple)) else [group_keys])]
+    values = np.asarray(values, dtype=float)
+    # np.lexsort sorts by its last key first
+    order = np.lexsort([values, *reversed(keys)])
+    same_group = np.ones(order.size - 1 if order.size else 0, dtype=bool)
+    for key in keys:
+        sorted_key = key[order]
+        same_group &= sorted_key[1:] == sorted_key[:-1]
+    diffs = np.diff(values[order])
+    return order[:-1][same_group], diffs[same_group]
+
+
+def __link_tracks(row_index, freqs, max_jump, max_gap):
+    """
+    Nearest-neighbour linking, one lag at a time for all peaks at once. A peak links to the closest
+    peak `lag` rows back that has no successor yet; when several peaks claim the same predecessor the
+    closest wins and the others fall back to their next-closest free peak in that row, so two tracks
+    crossing or running close together both continue. Peaks left without one try the next lag.
+    Returns the track id of every peak.
+    """
+    n = freqs.size
+    predecessor = np.full(n, -1)
+    has_successor = np.zeros(n, dtype=bool)
+    if n == 0:
+        return predecessor
+
+    # A single sortable key: rows are sorted first, frequency within the row
+    span = freqs.max() - freqs.min() + 1
+    key = row_index * span + (freqs - freqs.min())
+
+    for lag in range(1, max_gap + 2):
+        claimants = np.flatnonzero((predecessor < 0) & (row_index >= lag))
+        if claimants.size == 0:
+            break
+        target_row = row_index[claimants] - lag
+        # The free peaks of the target row nearest below and above each claimant's frequency
+        right = np.searchsorted(key, target_row * span + (freqs[claimants] - freqs.min()))
+        left = right - 1
+        while claimants.size:
+            left, right = __skip_taken(left, right, target_row, row_index, has_successor)
+            candidates = np.stack([left, right], axis=1)
+            valid = (candidates >= 0) & (candidates < n)
+            candidates = candidates.clip(0, n - 1)
+            valid &= row_index[candidates] == target_row[:, None]
+            distance = np.where(valid, np.abs(freqs[candidates] - freqs[claimants, None]), np.inf)
+            nearest = distance.argmin(axis=1)
+            chosen = candidates[np.arange(claimants.size), nearest]
+            chosen_distance = distance[np.arange(claimants.size), nearest]
+
+            # Later candidates are only farther away, so a claimant with none in reach is done at this lag
+            reachable = np.isfinite(chosen_distance)
+            if max_jump is not None:
+                reachable &= chosen_distance <= max_jump
+            # Closest claimant per predecessor wins
+            by_distance = np.flatnonzero(reachable)[np.argsort(chosen_distance[reachable], kind='stable')]
+            _, winners = np.unique(chosen[by_distance], return_index=True)
+            winners = by_distance[winners]
+            predecessor[claimants[winners]] = chosen[winners]
+            has_successor[chosen[winners]] = True
+
+            # The losers try again against the peaks still free
+            retry = reachable.copy()
+            retry[winners] = False
+            claimants, target_row, left, right = claimants[retry], target_row[retry], left[retry], right[retry]
+
+    # Follow predecessors to the first peak of each track (pointer jumping, log2(n) passes)
+    root = np.where(predecessor >= 0, predecessor, np.arange(n))
+    while True:
+        next_root = root[root]
+        if np.array_equal(next_root, root):
+            break
+        root = next_root
+    _, track = np.unique(root, return_inverse=True)
+    return track
+
+
+def __skip_taken(left, right, target_row, row_index, has_successor):
+    # Moves left down and right up past peaks of the target row that already have a successor
+    def taken(index):
+        inside = (index >= 0) & (index < row_index.size)
+        index = index.clip(0, row_index.size - 1)
+        return inside & (row_index[index] == target_row) & has_successor[index]
+
+    while True:
+        left_taken, right_taken = taken(left), taken(right)
+        if not (left_taken.any() or right_taken.any()):
+            return left, right
+        left = left - left_taken
+        right = right + right_taken
+
+
+def __coalesced(row_index, freqs, ending, continuing, edge, beyond):
+    """
+    Whether the continuing branch goes on through the coalesced peak past the ending branch's last
+    (or first) row `edge`: the continuing peak in the next row on the `beyond` side must lie between
+    the two branches at the edge.
+    """
+    ending_freq = freqs[ending][row_index[ending] == edge]
+    inside = continuing[(row_index[continuing] <= edge) if beyond > 0 else (row_index[continuing] >= edge)]
+    outside = continuing[(row_index[continuing] > edge) if beyond > 0 else (row_index[continuing] < edge)]
+    if ending_freq.size == 0 or inside.size == 0 or outside.size == 0:
+        return False
+    # Tracks are sorted by row, so the peaks nearest the edge sit at the ends of inside and outside
+    near_inside = freqs[inside[-1] if beyond > 0 else inside[0]]
+    near_outside = freqs[outside[0] if beyond > 0 else outside[-1]]
+    return min(ending_freq[0], near_inside) <= near_outside <= max(ending_freq[0], near_inside)
+
+
+def __branch_labels(row_index, freqs, track):
+    """
+    LOWER/UPPER for the peaks of the two longest tracks by their mean frequency, MERGED for the peaks of
+    the continuing track beyond a coalescence, OTHER for everything else.
+    """
+    branch = np.full(freqs.size, OTHER)
+    track_ids, sizes = np.unique(track, return_counts=True)
+    if track_ids.size < 2:
+        return branch
+
+    longest = track_ids[np.argsort(-sizes, kind='stable')[:2]]
+    members = [np.flatnonzero(track == track_id) for track_id in longest]
+    lower, upper = sorted(members, key=lambda peaks: freqs[peaks].mean())
+    branch[lower] = LOWER
+    branch[upper] = UPPER
+
+    # Rows where both branches exist; outside them at most one branch continues on each side
+    first = max(row_index[lower[0]], row_index[upper[0]])
+    last = min(row_index[lower[-1]], row_index[upper[-1]])
+    if first > last:
+        return branch
+    for edge, beyond in ((last, 1), (first, -1)):
+        outside = [peaks for peaks in (lower, upper)
+                   if ((row_index[peaks] > edge) if beyond > 0 else (row_index[peaks] < edge)).any()]
+        if len(outside) != 1:
+            continue
+        continuing = outside[0]
+        ending = upper if continuing is lower else lower
+        if __coalesced(row_index, freqs, ending, continuing, edge, beyond):
+            beyond_edge = (row_index[continuing] > edge) if beyond > 0 else (row_index[continuing] < edge)
+            branch[continuing[beyond_edge]] = MERGED
+    return branch
+
+
+@dataclass
+class Branches:
+    """
+    Peaks sorted by (row, frequency) with their branch label and track id, all as flat arrays.
+    """
+    row_name: str
+    rows: np.ndarray
+    freqs: np.ndarray
+    powers: np.ndarray
+    branch: np.ndarray
+    track: np.ndarray
+
+    def to_frame(self, mask=None):
+        mask = slice(None) if mask is None else mask
+        return pd.DataFrame({self.row_name: self.rows[mask], 'peak_freq': self.freqs[mask],
+                             'peak_power': self.powers[mask], 'branch': self.branch[mask],
+                             'track': self.track[mask]})
+
+    def lower(self):
+        return self.to_frame(self.branch == LOWER)
+
+    def upper(self):
+        return self.to_frame(self.branch == UPPER)
+
+    def merged(self):
+        return self.to_frame(self.branch == MERGED)
+
+    def splittings(self):
+        """
+        Frequency differences between neighbouring peaks of each row; returns (rows, differences).
+        """
+        lower, diffs = adjacent_differences(self.rows, self.freqs)
+        return self.rows[lower], diffs
+
+    def coalescence_row(self):
+        """
+        The row value where the branches meet: the merged row next to the rows where both branches are
+        present. None if the branches never coalesce.
+        """
+        merged_rows = self.rows[self.branch == MERGED]
+        if merged_rows.size == 0:
+            return None
+        split_rows = self.rows[(self.branch == LOWER) | (self.branch == UPPER)]
+        after = merged_rows[merged_rows > split_rows.max()]
+        return after.min() if after.size else merged_rows[merged_rows < split_rows.min()].max()
+
+    def tracks(self):
+        """
+        Splits the peaks into continuous curves; returns a list of (rows, freqs) array pairs, one per track.
+        """
+        order = np.lexsort([self.rows, self.track])
+        starts = np.flatnonzero(np.r_[True, np.diff(self.track[order]) != 0])
+        return [(self.rows[idx], self.freqs[idx]) for idx in np.split(order, starts[1:])]
+
+
+def track_branches(peaks_df, row_name, max_jump=None, max_gap=2):
+    """
+    Builds the Branches of a peaks_df (row_name, peak_freq, peak_power) as returned by __process_all_traces.
+    max_jump bounds the frequency step [Hz] between linked peaks; max_gap is how many rows a track may skip.
+    """
+    rows = peaks_df[row_name].to_numpy(dtype=float)
+    freqs = peaks_df['peak_freq'].to_numpy(dtype=float)
+    powers = peaks_df['peak_power'].to_numpy(dtype=float)
+    order = np.lexsort([freqs, rows])
+    rows, freqs, powers = rows[order], freqs[order], powers[order]
+
+    _, row_index = np.unique(rows, return_inverse=True)
+    track = __link_tracks(row_index, freqs, max_jump, max_gap)
+    branch = __branch_labels(row_index, freqs, track)
+    return Branches(row_name, rows, freqs, powers, branch, track)
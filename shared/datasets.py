@@ -0,0 +1,118 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+
+import pandas as pd
+
+from shared import generate_transmission_plots as gte
+
+# Bound at module level: inside the class body gte.__name would be mangled to gte._ExperimentDataset__name
+_get_engine = gte.__get_engine
+_get_data_from_db = gte.__get_data_from_db
+
+
+class ExperimentDataset:
+    """
+    Several acquisition databases behind one interface. Any experiment_id is resolved to the database
+    that holds it, and loads are run on a thread pool so that reading from N databases takes about as
+    long as the slowest read (SQLite releases the GIL while it reads).
+
+        dataset = ExperimentDataset(['wednesday_overnight', 'thursday_overmorning'], directory='../data')
+        pending = [dataset.submit(experiment_id) for experiment_id in experiment_ids]
+        grids = [future.result() for future in pending]
+    """
+
+    def __init__(self, db_names, directory=None, max_workers=None):
+        self.db_names = list(db_names)
+        self.engines = {db_name: _get_engine(os.path.join(directory, db_name) if directory else db_name)
+                        for db_name in self.db_names}
+        # ThreadPoolExecutor's own default, kept to bound iter_all
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='dataset')
+        self.sources = None  # experiment_id -> db_name, built by experiment_ids()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def source(self, experiment_id):
+        """
+        Returns the name of the database holding experiment_id. If several hold it, the first listed wins.
+        The first call lists the ids of every database once; a probe per id and database would be a full
+        table scan for every miss on an unindexed database.
+        """
+        if self.sources is None:
+            self.experiment_ids()
+        if experiment_id not in self.sources:
+            raise KeyError(f'Experiment {experiment_id} is not in any of {self.db_names}')
+        return self.sources[experiment_id]
+
+    def engine(self, experiment_id):
+        return self.engines[self.source(experiment_id)]
+
+    def experiment_ids(self):
+        """
+        Returns [(db_name, experiment_id)] for every experiment of every database, listing the databases concurrently.
+        """
+        def list_ids(db_name):
+            ids = pd.read_sql_query(f'SELECT DISTINCT experiment_id FROM {gte.TABLE_NAME}', self.engines[db_name])
+            return [(db_name, experiment_id) for experiment_id in ids['experiment_id']]
+
+        pairs = [pair for ids in self.executor.map(list_ids, self.db_names) for pair in ids]
+        self.sources = {}
+        for db_name, experiment_id in pairs:
+            self.sources.setdefault(experiment_id, db_name)
+        return pairs
+
+    def submit(self, experiment_id, loader=_get_data_from_db, **kwargs):
+        """
+        Starts loader(engine, experiment_id, **kwargs) on the pool and returns its Future.
+        The default loader is __get_data_from_db, so kwargs are its window/cache/fetch options.
+        """
+        # Resolved here rather than on the pool, where listing the databases would wait on the pool itself
+        return self.executor.submit(loader, self.engine(experiment_id), experiment_id, **kwargs)
+
+    def load_many(self, experiment_ids, loader=_get_data_from_db, **kwargs):
+        futures = [self.submit(experiment_id, loader, **kwargs) for experiment_id in experiment_ids]
+        return [future.result() for future in futures]
+
+    def iter_all(self, loader=_get_data_from_db, max_in_flight=None, **kwargs):
+        """
+        Loads every experiment of every database and yields (db_name, experiment_id, result). At most
+        max_in_flight loads (default: the pool size) run or wait ahead of the consumer, so memory holds
+        that many results plus the one being used, not every experiment at once. The databases take turns,
+        one experiment each, so the loads in flight are spread over all of them; within a database the
+        experiments keep their listing order.
+        """
+        max_in_flight = max(max_in_flight or self.max_workers, 1)
+        pairs = self.experiment_ids()
+        per_database = [[pair for pair in pairs if pair[0] == db_name] for db_name in self.db_names]
+        interleaved = [pair for turn in zip_longest(*per_database) for pair in turn if pair is not None]
+
+        ahead = deque()
+        for db_name, experiment_id in interleaved:
+            # Each experiment is read from the database it was listed in, even if another database repeats its id
+            ahead.append((db_name, experiment_id,
+                          self.executor.submit(loader, self.engines[db_name], experiment_id, **kwargs)))
+            if len(ahead) >= max_in_flight:
+                db_name, experiment_id, future = ahead.popleft()
+                yield db_name, experiment_id, future.result()
+        while ahead:
+            db_name, experiment_id, future = ahead.popleft()
+            yield db_name, experiment_id, future.result()
+
+    def load_all(self, loader=_get_data_from_db, **kwargs):
+        """
+        Loads every experiment of every database concurrently; returns [(db_name, experiment_id, result)].
+        """
+        pairs = self.experiment_ids()
+        # Each experiment is read from the database it was listed in, even if another database repeats its id
+        futures = [self.executor.submit(loader, self.engines[db_name], experiment_id, **kwargs)
+                   for db_name, experiment_id in pairs]
+        return [(db_name, experiment_id, future.result()) for (db_name, experiment_id), future in zip(pairs, futures)]
@@ -0,0 +1,173 @@
+"""
+Maintenance command for the acquisition databases.
+
+Adds covering indexes on the expr table for the queries the figure modules issue, and reports
+EXPLAIN QUERY PLAN for each of those queries. A query is flagged when it scans the table, sorts
+through a temporary B-tree, or looks up table rows through an index that does not cover it.
+
+    python -m shared.db_indexes data/loop_14.5_dB_1.db                  # index in place and report
+    python -m shared.db_indexes data/loop_14.5_dB_1.db --copy out.db    # index a copy, leave the original alone
+    python -m shared.db_indexes data/loop_14.5_dB_1.db --explain-only   # only report the query plans
+"""
+import argparse
+import sqlite3
+
+from shared.generate_transmission_plots import TABLE_NAME, SETTINGS_COLUMNS
+
+# name -> indexed columns. Each index covers every column its queries read, so SQLite never touches the table rows.
+INDEXES = {
+    # __get_data_from_db, __get_frequency_trace, __iter_experiments and SELECT DISTINCT experiment_id
+    f'idx_{TABLE_NAME}_experiment_voltage_freq': ['experiment_id', 'set_voltage', 'frequency_hz', 'power_dBm'],
+    # __get_voltage_trace
+    f'idx_{TABLE_NAME}_experiment_freq_voltage': ['experiment_id', 'frequency_hz', 'set_voltage', 'power_dBm'],
+    # figure2/frame_D.__get_data_from_db
+    f'idx_{TABLE_NAME}_experiment_attenuation_freq': ['experiment_id', 'set_cavity_fb_att', 'frequency_hz',
+                                                      'power_dBm'],
+    # Settings lookups, per experiment and for all experiments at once; frame_D also reads set_voltage
+    f'idx_{TABLE_NAME}_experiment_settings': ['experiment_id', *SETTINGS_COLUMNS, 'set_voltage'],
+}
+
+
+def figure_queries(experiment_id, freq_min=1e9, freq_max=99e9, voltage_min=-2.0, voltage_max=2.0,
+                   voltage=0, freq=6e9):
+    """
+    Returns name -> SQL for every query the figure modules issue, instantiated for one experiment.
+    """
+    settings = ', '.join(SETTINGS_COLUMNS)
+    return {
+        'experiment ids': f"SELECT DISTINCT experiment_id FROM {TABLE_NAME}",
+        'settings': f"""
+            SELECT DISTINCT {settings} FROM {TABLE_NAME}
+            WHERE experiment_id = '{experiment_id}'""",
+        'voltage grid': f"""
+            SELECT frequency_hz, set_voltage, power_dBm FROM {TABLE_NAME}
+            WHERE experiment_id = '{experiment_id}'
+            AND set_voltage BETWEEN {voltage_min} AND {voltage_max}
+            AND frequency_hz BETWEEN {freq_min} AND {freq_max}
+            ORDER BY set_voltage, frequency_hz""",
+        'frequency trace': f"""
+            SELECT frequency_hz, power_dBm FROM {TABLE_NAME}
+            WHERE experiment_id = '{experiment_id}'
+            AND set_voltage = {voltage}
+            AND frequency_hz BETWEEN {freq_min} AND {freq_max}
+            ORDER BY frequency_hz""",
+        'voltage trace': f"""
+            SELECT set_voltage, power_dBm FROM {TABLE_NAME}
+            WHERE experiment_id = '{experiment_id}'
+            AND frequency_hz = {freq}
+            AND set_voltage BETWEEN {voltage_min} AND {voltage_max}
+            ORDER BY set_voltage""",
+        'bulk settings': f"SELECT DISTINCT experiment_id, {settings} FROM {TABLE_NAME}",
+        'bulk voltage grids': f"""
+            SELECT experiment_id, frequency_hz, set_voltage, power_dBm FROM {TABLE_NAME}
+            WHERE set_voltage BETWEEN {voltage_min} AND {voltage_max}
+            AND frequency_hz BETWEEN {freq_min} AND {freq_max}
+            ORDER BY experiment_id, set_voltage, frequency_hz""",
+        'attenuation grid': f"""
+            SELECT frequency_hz, set_cavity_fb_att, power_dBm FROM {TABLE_NAME}
+            WHERE experiment_id = '{experiment_id}'
+            AND +frequency_hz BETWEEN {freq_min} AND {freq_max}
+            ORDER BY set_cavity_fb_att, frequency_hz""",
+        'attenuation settings': f"""
+            SELECT set_loop_phase_deg, set_loop_att, set_loopback_att, set_yig_fb_phase_deg, set_voltage,
+                   set_yig_fb_att FROM {TABLE_NAME}
+            WHERE experiment_id = '{experiment_id}'""",
+    }
+
+
+def copy_database(src_path, dst_path):
+    src = sqlite3.connect(f'file:{src_path}?mode=ro', uri=True)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def create_indexes(db_path):
+    con = sqlite3.connect(db_path)
+    try:
+        for name, columns in INDEXES.items():
+            # Indexes built from an older INDEXES definition are rebuilt with the current columns
+            existing = [row[2] for row in con.execute(f'PRAGMA index_info({name})')]
+            if existing and existing != columns:
+                print(f'Rebuilding index {name}...')
+                con.execute(f'DROP INDEX {name}')
+            print(f'Creating index {name}...')
+            con.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {TABLE_NAME} ({', '.join(columns)})")
+        # Give the query planner row statistics for the new indexes
+        con.execute('ANALYZE')
+        con.commit()
+    finally:
+        con.close()
+
+
+def __plan_problems(details):
+    problems = []
+    for detail in details:
+        table_step = detail.startswith((f'SCAN {TABLE_NAME}', f'SEARCH {TABLE_NAME}'))
+        # "SCAN expr" without an index means every row of the table is read
+        if table_step and 'INDEX' not in detail and 'PRIMARY KEY' not in detail:
+            problems.append('TABLE SCAN')
+        # A non-covering index reads the table row of every match as well
+        elif table_step and 'USING INDEX' in detail:
+            problems.append('NOT COVERING')
+        # The ORDER BY or DISTINCT is not delivered by the index, so the rows are sorted first
+        if 'TEMP B-TREE' in detail:
+            problems.append('TEMP B-TREE')
+    return problems
+
+
+def explain_queries(db_path, experiment_id=None):
+    """
+    Returns [(query name, [plan details], [problems])] for every figure query; problems is empty when an
+    index serves the query on its own, in the order it needs.
+    """
+    con = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        if experiment_id is None:
+            row = con.execute(f'SELECT experiment_id FROM {TABLE_NAME} LIMIT 1').fetchone()
+            experiment_id = row[0] if row else ''
+
+        report = []
+        for name, query in figure_queries(experiment_id).items():
+            details = [row[-1] for row in con.execute(f'EXPLAIN QUERY PLAN {query}')]
+            report.append((name, details, __plan_problems(details)))
+        return report
+    finally:
+        con.close()
+
+
+def print_report(report):
+    for name, details, problems in report:
+        status = ', '.join(problems) if problems else 'ok'
+        print(f'{name:<22} [{status}]')
+        for detail in details:
+            print(f'    {detail}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index an acquisition database and check the figure query plans.')
+    parser.add_argument('db_path', help='path to the .db file')
+    parser.add_argument('--copy', metavar='DST', help='index a copy written to DST instead of the original')
+    parser.add_argument('--explain-only', action='store_true', help='only report the query plans')
+    parser.add_argument('--experiment-id', help='experiment used to instantiate the queries (default: any)')
+    args = parser.parse_args()
+
+    db_path = args.db_path
+    if not args.explain_only:
+        if args.copy:
+            print(f'Copying {db_path} to {args.copy}...')
+            copy_database(db_path, args.copy)
+            db_path = args.copy
+        create_indexes(db_path)
+
+    report = explain_queries(db_path, args.experiment_id)
+    print_report(report)
+    if any(problems for _, _, problems in report):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
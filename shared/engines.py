@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine, event
+
+# The figure pipeline only reads, so the databases are opened read-only with a large page cache and mmap
+MMAP_SIZE = 8 * 1024 ** 3  # bytes; SQLite clamps this to its compile-time maximum
+CACHE_SIZE_KIB = 512 * 1024
+
+
+def create_readonly_engine(db_path, immutable=True, mmap_size=MMAP_SIZE, cache_size_kib=CACHE_SIZE_KIB):
+    """
+    Returns a SQLAlchemy engine that opens db_path read-only.
+    With immutable=True SQLite also skips all file locking and change detection, which is only safe for
+    databases nothing is writing to anymore; pass immutable=False for a DB that is still being acquired.
+    """
+    uri_params = 'mode=ro&immutable=1' if immutable else 'mode=ro'
+    engine = create_engine(f'sqlite:///file:{db_path}?{uri_params}&uri=true')
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA mmap_size = {int(mmap_size)}')
+        cursor.execute(f'PRAGMA cache_size = -{int(cache_size_kib)}')  # negative means KiB rather than pages
+        cursor.execute('PRAGMA query_only = ON')
+        cursor.close()
+
+    return engine
+
+
+def engine_db_path(engine):
+    """
+    Returns the filesystem path of a SQLite engine's database, for plain and URI-style URLs alike.
+    """
+    database = engine.url.database
+    if database and database.startswith('file:'):
+        database = database[len('file:'):]
+    return database
@@ -1,11 +1,28 @@
 import pandas as pd
-from sqlalchemy import create_engine
 import matplotlib.pyplot as plt
 import os
 import numpy as np  # NumPy is required for numerical computations
 
+from shared import grid_cache, parquet_store
+from shared.engines import create_readonly_engine, engine_db_path
+from shared.grids import build_grid, compact_grid
+from shared.prefetch import prefetch
+
 TABLE_NAME = 'expr'
 
+SETTINGS_COLUMNS = ['set_loop_phase_deg', 'set_loop_att', 'set_loopback_att',
+                    'set_cavity_fb_phase_deg', 'set_cavity_fb_att',
+                    'set_yig_fb_phase_deg', 'set_yig_fb_att']
+
+# Rows fetched per round trip when streaming a whole table
+BULK_CHUNK_ROWS = 500_000
+
+# Row layout of the measurement columns for the numpy fetch path
+MEASUREMENT_DTYPE = np.dtype([('frequency_hz', np.float64), ('set_voltage', np.float64), ('power_dBm', np.float64)])
+
+# Fraction of the visible span loaded beyond each display limit
+VIEW_MARGIN = 0.05
+
 LABEL_FONT_SIZE = 19
 TICK_FONT_SIZE = 15
 SAVE_DPI = 400
@@ -16,11 +33,49 @@ SAVE_DPI = 400
 ####
 
 
-def __get_engine(db_name):
-    return create_engine(f'sqlite:///{db_name}.db')
+def __get_engine(db_name, backend='sqlite'):
+    # backend='parquet' reads the columnar export written by shared.parquet_store next to the .db file
+    if backend == 'parquet':
+        return parquet_store.ParquetDataset(f'{db_name}.parquet')
+    return create_readonly_engine(f'{db_name}.db')
+
+
+def __get_data_from_db(engine, experiment_id, freq_min=1e9, freq_max=99e9, voltage_min=-2.0, voltage_max=2.0,
+                       use_cache=True, fetch='pandas', compact=None):
+    # compact='float32' or 'int16' (see shared.grids.compact_grid) shrinks power_grid for holding many grids at once
+    if isinstance(engine, parquet_store.ParquetDataset):
+        power_grid, voltages, frequencies, settings = parquet_store.load_grid(engine, experiment_id, freq_min, freq_max,
+                                                                              voltage_min, voltage_max)
+        return compact_grid(power_grid, compact), voltages, frequencies, settings
+
+    # The .db files never change once an experiment is done, so finished grids are cached on disk
+    db_path = engine_db_path(engine)
+    key = None
+    if use_cache and db_path and os.path.isfile(db_path):
+        key_extra = () if compact is None else (compact,)
+        key = grid_cache.cache_key(db_path, experiment_id, freq_min, freq_max, voltage_min, voltage_max, *key_extra)
+        cached = grid_cache.load(key)
+        if cached is not None:
+            return cached
+
+    # fetch='numpy' reads the rows straight into typed arrays instead of going through a DataFrame
+    if fetch == 'numpy':
+        query_grid = __query_grid_numpy
+    elif fetch == 'pandas':
+        query_grid = __query_grid
+    else:
+        raise ValueError(f"Unknown fetch mode {fetch!r}, expected 'pandas' or 'numpy'")
+    power_grid, voltages, frequencies, settings = query_grid(engine, experiment_id, freq_min, freq_max,
+                                                             voltage_min, voltage_max)
+    power_grid = compact_grid(power_grid, compact)
+
+    if key is not None:
+        grid_cache.store(key, power_grid, voltages, frequencies, settings)
+
+    return power_grid, voltages, frequencies, settings
 
 
-def __get_data_from_db(engine, experiment_id, freq_min=1e9, freq_max=99e9, voltage_min=-2.0, voltage_max=2.0):
+def __query_settings(engine, experiment_id):
     # Query the apparatus settings for the experiment
     settings_query = f"""
     SELECT DISTINCT set_loop_phase_deg, set_loop_att, set_loopback_att,
@@ -29,27 +84,168 @@ def __get_data_from_db(engine, experiment_id, freq_min=1e9, freq_max=99e9, volta
     FROM {TABLE_NAME}
     WHERE experiment_id = '{experiment_id}'
     """
-    settings = pd.read_sql_query(settings_query, engine).iloc[0]
+    return pd.read_sql_query(settings_query, engine).iloc[0]
 
-    # Query the measurement data
-    data_query = f"""
+
+def __grid_data_query(experiment_id, freq_min, freq_max, voltage_min, voltage_max):
+    return f"""
     SELECT frequency_hz, set_voltage, power_dBm FROM {TABLE_NAME}
     WHERE experiment_id = '{experiment_id}'
     AND set_voltage BETWEEN {voltage_min} AND {voltage_max}
     AND frequency_hz BETWEEN {freq_min} AND {freq_max}
     ORDER BY set_voltage, frequency_hz
     """
+
+
+def __query_grid(engine, experiment_id, freq_min, freq_max, voltage_min, voltage_max):
+    settings = __query_settings(engine, experiment_id)
+
+    # Query the measurement data
+    data_query = __grid_data_query(experiment_id, freq_min, freq_max, voltage_min, voltage_max)
     data = pd.read_sql_query(data_query, engine)
 
-    pivot_table = data.pivot_table(index='set_voltage', columns='frequency_hz', values='power_dBm', aggfunc='first')
+    power_grid, voltages, frequencies = build_grid(data['set_voltage'], data['frequency_hz'], data['power_dBm'])
+
+    return power_grid, voltages, frequencies, settings
+
 
-    frequencies = pivot_table.columns.values
-    voltages = pivot_table.index.values
-    power_grid = pivot_table.values
+def __query_grid_numpy(engine, experiment_id, freq_min, freq_max, voltage_min, voltage_max):
+    settings = __query_settings(engine, experiment_id)
+
+    # Stream the cursor into one structured array; only a single row tuple exists in Python at a time
+    data_query = __grid_data_query(experiment_id, freq_min, freq_max, voltage_min, voltage_max)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(data_query)
+            data = np.fromiter(cursor, dtype=MEASUREMENT_DTYPE)
+        except TypeError:
+            # NULL measurements cannot be stored in a float field; let pandas turn them into NaN
+            return __query_grid(engine, experiment_id, freq_min, freq_max, voltage_min, voltage_max)
+        finally:
+            cursor.close()
+    finally:
+        connection.close()
+
+    power_grid, voltages, frequencies = build_grid(data['set_voltage'], data['frequency_hz'], data['power_dBm'])
 
     return power_grid, voltages, frequencies, settings
 
 
+def __iter_experiments(engine, freq_min=1e9, freq_max=99e9, voltage_min=-2.0, voltage_max=2.0,
+                       chunksize=BULK_CHUNK_ROWS, compact=None):
+    """
+    Streams the whole table once, ordered by experiment, and yields
+    (experiment_id, power_grid, voltages, frequencies, settings) for each experiment in turn.
+    Only the experiment being assembled is held in memory.
+
+    The ordered scan needs an index led by (experiment_id, set_voltage, frequency_hz), see
+    shared.db_indexes; without one SQLite would sort the whole table before returning the first row.
+    The table is then still read in one unordered scan, but sorted in memory, so memory holds the
+    measurement columns of every experiment in the window instead of one experiment.
+    """
+    # Settings of every experiment in a single pass, first row per experiment as in __get_data_from_db
+    settings_query = f"""
+    SELECT DISTINCT experiment_id, {', '.join(SETTINGS_COLUMNS)}
+    FROM {TABLE_NAME}
+    """
+    all_settings = pd.read_sql_query(settings_query, engine).drop_duplicates('experiment_id')
+    all_settings = all_settings.set_index('experiment_id').sort_index()
+
+    data_query = f"""
+    SELECT experiment_id, frequency_hz, set_voltage, power_dBm FROM {TABLE_NAME}
+    WHERE set_voltage BETWEEN {voltage_min} AND {voltage_max}
+    AND frequency_hz BETWEEN {freq_min} AND {freq_max}
+    """
+    ordered_query = f'{data_query}ORDER BY experiment_id, set_voltage, frequency_hz'
+    if __needs_sort(engine, ordered_query):
+        yield from __iter_experiments_sorted_in_memory(engine, data_query, all_settings, chunksize, compact)
+        return
+
+    # Chunks do not line up with experiments, so pieces of the current experiment are collected until its id changes
+    pending = []
+    for chunk in pd.read_sql_query(ordered_query, engine, chunksize=chunksize):
+        experiment_ids = chunk['experiment_id'].values
+        boundaries = np.flatnonzero(experiment_ids[1:] != experiment_ids[:-1]) + 1
+        for start, end in zip([0, *boundaries], [*boundaries, len(chunk)]):
+            piece = chunk.iloc[start:end]
+            if pending and pending[0]['experiment_id'].iat[0] != piece['experiment_id'].iat[0]:
+                yield __assemble_experiment(pending, all_settings, compact)
+                pending = []
+            pending.append(piece)
+
+    if pending:
+        yield __assemble_experiment(pending, all_settings, compact)
+
+
+def __iter_experiments_sorted_in_memory(engine, data_query, all_settings, chunksize, compact=None):
+    # Experiment ids are kept as codes into the sorted settings index, so a row costs 4 + 3 * 8 bytes
+    experiment_ids = all_settings.index.to_numpy()
+    codes, frequencies, voltages, powers = [], [], [], []
+    for chunk in pd.read_sql_query(data_query, engine, chunksize=chunksize):
+        codes.append(all_settings.index.get_indexer(chunk['experiment_id']).astype(np.int32))
+        frequencies.append(chunk['frequency_hz'].to_numpy(dtype=float))
+        voltages.append(chunk['set_voltage'].to_numpy(dtype=float))
+        powers.append(chunk['power_dBm'].to_numpy(dtype=float))
+    if not codes:
+        return
+    codes, frequencies, voltages, powers = (np.concatenate(column) for column in (codes, frequencies, voltages,
+                                                                                  powers))
+
+    # Same order as ORDER BY experiment_id, set_voltage, frequency_hz
+    order = np.lexsort([frequencies, voltages, codes])
+    sorted_codes = codes[order]
+    boundaries = np.flatnonzero(sorted_codes[1:] != sorted_codes[:-1]) + 1
+    for start, end in zip([0, *boundaries], [*boundaries, order.size]):
+        rows = order[start:end]
+        experiment_id = experiment_ids[sorted_codes[start]]
+        power_grid, grid_voltages, grid_frequencies = build_grid(voltages[rows], frequencies[rows], powers[rows])
+        yield (experiment_id, compact_grid(power_grid, compact), grid_voltages, grid_frequencies,
+               all_settings.loc[experiment_id])
+
+
+def __needs_sort(engine, query):
+    # SQLite reports a temporary B-tree in the query plan when no index delivers the ORDER BY
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f'EXPLAIN QUERY PLAN {query}')
+            return any('TEMP B-TREE' in row[-1] for row in cursor.fetchall())
+        finally:
+            cursor.close()
+    finally:
+        connection.close()
+
+
+def __assemble_experiment(pieces, all_settings, compact=None):
+    data = pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0]
+    experiment_id = data['experiment_id'].iat[0]
+    power_grid, voltages, frequencies = build_grid(data['set_voltage'], data['frequency_hz'], data['power_dBm'])
+    return experiment_id, compact_grid(power_grid, compact), voltages, frequencies, all_settings.loc[experiment_id]
+
+
+def __view_window(voltage_lim=None, freq_lim=None, margin=VIEW_MARGIN):
+    """
+    Converts the display limits of a frame into __get_data_from_db bounds, so only the visible region is
+    read and gridded. voltage_lim is (min, max) in V and freq_lim is (min, max) in Hz; each is widened by
+    margin times its span on both sides. A limit left as None keeps the loader's default bound.
+    """
+    window = {}
+    if voltage_lim is not None:
+        voltage_min, voltage_max = sorted(voltage_lim)
+        pad = (voltage_max - voltage_min) * margin
+        window['voltage_min'] = voltage_min - pad
+        window['voltage_max'] = voltage_max + pad
+    if freq_lim is not None:
+        freq_min, freq_max = sorted(freq_lim)
+        pad = (freq_max - freq_min) * margin
+        window['freq_min'] = freq_min - pad
+        window['freq_max'] = freq_max + pad
+    return window
+
+
 def __get_frequency_trace(engine, experiment_id, freq_min=1e9, freq_max=99e9, voltage=0):
     data_query = f"""
     SELECT frequency_hz, power_dBm FROM {TABLE_NAME}
@@ -81,7 +277,6 @@ def generate_transmission_plot_from_ax(ax, power_grid, voltages, frequencies, ex
 
     # Slightly compress the color plot by adjusting the axis limits
     # ax.set_position([ax.get_position().x0, ax.get_position().y0, 0.85 * ax.get_position().width, ax.get_position().height])
-    from mpl_toolkits.axes_grid1.inset_locator import inset_axes
     # Create an inset_axes for the colorbar, positioning it on the right with custom size and padding
     # axins = inset_axes(ax,
     #                    width="5%",      # Make it thinner
@@ -208,14 +403,21 @@ def __save_derivative_plot_to_file(fig, db_name, experiment_id):
 
 def plot_all_experiments(db_name, freq_min=1e9, freq_max=99e9, voltage_min=-2.0, voltage_max=2.0,
                          vmin_transmission=-40, vmax_transmission=8,
-                         vmin_derivative=0, vmax_derivative=None):
+                         vmin_derivative=0, vmax_derivative=None, bulk=False,
+                         prefetch_depth=0):
     engine = __get_engine(db_name)
-    experiment_ids = pd.read_sql_query(f'SELECT DISTINCT experiment_id FROM {TABLE_NAME}', engine)
-
-    for experiment_id in experiment_ids['experiment_id']:
+    if bulk:
+        # One scan of the table for all experiments instead of two queries per experiment
+        experiments = __iter_experiments(engine, freq_min, freq_max, voltage_min, voltage_max)
+    else:
+        experiment_ids = pd.read_sql_query(f'SELECT DISTINCT experiment_id FROM {TABLE_NAME}', engine)
+        experiments = ((experiment_id, *__get_data_from_db(engine, experiment_id, freq_min, freq_max,
+                                                           voltage_min, voltage_max))
+                       for experiment_id in experiment_ids['experiment_id'])
+
+    # With prefetch_depth > 0 the next experiments load on a background thread while this one renders
+    for experiment_id, power_grid, voltages, frequencies, settings in prefetch(experiments, prefetch_depth):
         print(f'Plotting experiment {experiment_id}...')
-        power_grid, voltages, frequencies, settings = __get_data_from_db(engine, experiment_id, freq_min, freq_max,
-                                                                         voltage_min, voltage_max)
         fig = __generate_transmission_plot(power_grid, voltages, frequencies, experiment_id, settings,
                                            vmin=vmin_transmission, vmax=vmax_transmission)
         __save_plot_to_file(fig, db_name, experiment_id)
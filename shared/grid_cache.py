@@ -0,0 +1,115 @@
+import hashlib
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from shared.grids import QuantizedGrid
+
+# Cached grids live next to the databases they were read from
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', '.grid_cache')
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3  # 4 GB
+
+CACHE_SUFFIX = '.npz'
+
+
+def cache_key(db_path, experiment_id, freq_min, freq_max, voltage_min, voltage_max, *extra):
+    """
+    Builds the cache key for one grid. The DB's mtime and size are part of the key, so a DB that is
+    rewritten or replaced never serves a stale grid.
+    """
+    stat = os.stat(db_path)
+    parts = [os.path.abspath(db_path), stat.st_mtime_ns, stat.st_size, experiment_id,
+             repr(float(freq_min)), repr(float(freq_max)), repr(float(voltage_min)), repr(float(voltage_max))]
+    parts.extend(repr(part) for part in extra)
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def __cache_path(key, cache_dir):
+    return os.path.join(cache_dir, key + CACHE_SUFFIX)
+
+
+def load(key, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Returns the cached (power_grid, voltages, frequencies, settings) tuple, or None on a miss.
+    """
+    path = __cache_path(key, cache_dir)
+    try:
+        # Settings are stored as an object array so ints and text come back unchanged
+        with np.load(path, allow_pickle=True) as cached:
+            if 'power_codes' in cached:
+                power_grid = QuantizedGrid(cached['power_codes'], float(cached['power_scale']),
+                                           float(cached['power_offset']))
+            else:
+                power_grid = cached['power_grid']
+            voltages = cached['voltages']
+            frequencies = cached['frequencies']
+            settings = pd.Series(list(cached['settings_values']), index=cached['settings_names'].tolist(), name=0,
+                                 dtype=str(cached['settings_dtype']))
+    except (OSError, KeyError, ValueError):
+        return None
+
+    # Touch the entry so eviction is least-recently-used rather than oldest-written
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return power_grid, voltages, frequencies, settings
+
+
+def store(key, power_grid, voltages, frequencies, settings, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = __cache_path(key, cache_dir)
+
+    if isinstance(power_grid, QuantizedGrid):
+        power_arrays = {'power_codes': power_grid.codes, 'power_scale': power_grid.scale,
+                        'power_offset': power_grid.offset}
+    else:
+        power_arrays = {'power_grid': power_grid}
+
+    # Write to a private temporary file first so readers never see a half-written entry
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f,
+                 **power_arrays,
+                 voltages=voltages,
+                 frequencies=frequencies,
+                 settings_names=np.array(settings.index, dtype=str),
+                 settings_values=np.asarray(settings.values, dtype=object),
+                 settings_dtype=np.array(str(settings.dtype)))
+    os.replace(tmp_path, path)
+
+    evict(max_bytes, cache_dir)
+
+
+def evict(max_bytes=DEFAULT_MAX_BYTES, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Deletes least-recently-used entries until the cache directory is at most max_bytes.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(CACHE_SUFFIX):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        total -= size
+
+
+def clear(cache_dir=DEFAULT_CACHE_DIR):
+    evict(0, cache_dir)
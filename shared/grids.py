@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Compact power grid representations; None keeps float64
+COMPACT_MODES = (None, 'float32', 'int16')
+
+# The VNA power readings are not meaningful below ~0.01 dB
+QUANT_STEP_DB = 0.01
+INT16_NAN = np.iinfo(np.int16).min
+INT16_MAX_CODE = np.iinfo(np.int16).max
+
+
+def build_grid(row_keys, column_keys, values):
+    """
+    Assembles a 2D grid from long-format rows, the same result as
+    DataFrame.pivot_table(index=row_keys, columns=column_keys, values=values, aggfunc='first').
+    Complete sweeps are filled straight into a preallocated array; ragged sweeps, duplicate
+    points and NaNs fall back to pivot_table.
+    Returns (grid, row_values, column_values).
+    """
+    row_keys = np.asarray(row_keys, dtype=float)
+    column_keys = np.asarray(column_keys, dtype=float)
+    values = np.asarray(values, dtype=float)
+
+    if values.size == 0 or np.isnan(row_keys).any() or np.isnan(column_keys).any() or np.isnan(values).any():
+        return __pivot_grid(row_keys, column_keys, values)
+
+    rows = __sorted_unique(row_keys)
+    columns = __sorted_unique(column_keys)
+    if rows.size * columns.size != values.size:
+        # Missing points (ragged sweep) or repeated points
+        return __pivot_grid(row_keys, column_keys, values)
+
+    # Rows arrive ORDER BY row, column from SQL, in which case the grid is a plain reshape
+    grid_shape = (rows.size, columns.size)
+    if ((row_keys.reshape(grid_shape) == rows[:, None]).all()
+            and (column_keys.reshape(grid_shape) == columns).all()):
+        return values.reshape(grid_shape).copy(), rows, columns
+
+    # Otherwise scatter each value to its cell; every cell must be hit exactly once
+    row_idx = np.searchsorted(rows, row_keys)
+    column_idx = np.searchsorted(columns, column_keys)
+    flat_idx = row_idx * columns.size + column_idx
+    hits = np.bincount(flat_idx, minlength=values.size)
+    if not (hits == 1).all():
+        return __pivot_grid(row_keys, column_keys, values)
+
+    grid = np.empty(values.size)
+    grid[flat_idx] = values
+    return grid.reshape(grid_shape), rows, columns
+
+
+def __sorted_unique(keys):
+    # Already-sorted keys (the common case) avoid np.unique's sort
+    if keys.size > 1 and (keys[1:] >= keys[:-1]).all():
+        return keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+    return np.unique(keys)
+
+
+def __pivot_grid(row_keys, column_keys, values):
+    data = pd.DataFrame({'row': row_keys, 'column': column_keys, 'value': values})
+    pivot_table = data.pivot_table(index='row', columns='column', values='value', aggfunc='first')
+    return pivot_table.values, pivot_table.index.values, pivot_table.columns.values
+
+
+@dataclass(eq=False)
+class QuantizedGrid:
+    """
+    Power grid stored as int16 codes, value = codes * scale + offset, with INT16_NAN marking missing points.
+    Behaves like a read-only float32 array for numpy, scipy and matplotlib (np.asarray, slicing, .T),
+    dequantizing only the part that is accessed.
+    """
+    codes: np.ndarray
+    scale: float
+    offset: float
+
+    def __dequantize(self, codes):
+        values = codes.astype(np.float32) * np.float32(self.scale) + np.float32(self.offset)
+        values[codes == INT16_NAN] = np.nan
+        return values
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.__dequantize(self.codes)
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def __getitem__(self, index):
+        return self.__dequantize(np.asarray(self.codes[index]))
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def ndim(self):
+        return self.codes.ndim
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    @property
+    def T(self):
+        return np.asarray(self).T
+
+
+def quantize_grid(power_grid, step=QUANT_STEP_DB):
+    power_grid = np.asarray(power_grid, dtype=float)
+    finite = power_grid[np.isfinite(power_grid)]
+    if finite.size == 0:
+        offset, scale = 0.0, step
+    else:
+        low, high = finite.min(), finite.max()
+        offset = (low + high) / 2
+        # Coarsen the step only if the range would not fit in int16
+        scale = max(step, (high - low) / (2 * INT16_MAX_CODE))
+
+    codes = np.rint((power_grid - offset) / scale)
+    codes = np.where(np.isfinite(codes), np.clip(codes, -INT16_MAX_CODE, INT16_MAX_CODE), INT16_NAN)
+    return QuantizedGrid(codes.astype(np.int16), float(scale), float(offset))
+
+
+def compact_grid(power_grid, compact):
+    """
+    Converts a float64 power grid to the compact representation named by compact (see COMPACT_MODES).
+    float32 halves the memory and int16 quarters it; frequencies and voltages stay float64, since
+    GHz readout frequencies need more than float32's 7 significant digits.
+    """
+    if compact is None or isinstance(power_grid, QuantizedGrid):
+        return power_grid
+    if compact == 'float32':
+        return np.asarray(power_grid, dtype=np.float32)
+    if compact == 'int16':
+        return quantize_grid(power_grid)
+    raise ValueError(f'Unknown compact mode {compact!r}, expected one of {COMPACT_MODES}')
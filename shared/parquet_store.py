@@ -0,0 +1,113 @@
+"""
+Columnar copies of the acquisition databases.
+
+A database is exported to a directory of Parquet files partitioned by experiment_id
+(<dataset>/experiment_id=<id>/part-0.parquet). Settings that are constant within an experiment are
+stored once, in the file metadata, instead of on every row. Loading reads only the measurement
+columns and pushes the frequency/voltage window down to the Parquet row groups.
+
+    python -m shared.parquet_store ../data/loop_14.5_dB_1.db ../data/loop_14.5_dB_1.parquet
+
+Requires pyarrow, which the SQLite pipeline does not need.
+"""
+import argparse
+import json
+import os
+from dataclasses import dataclass
+
+import pandas as pd
+
+from shared.grids import build_grid
+
+PARTITION_COLUMN = 'experiment_id'
+PARTITION_FILE = 'part-0.parquet'
+SETTINGS_METADATA_KEY = b'settings'
+
+DEFAULT_COMPRESSION = 'zstd'
+ROW_GROUP_SIZE = 256 * 1024
+
+
+@dataclass(frozen=True)
+class ParquetDataset:
+    """
+    Stands in for an engine: __get_data_from_db reads from the dataset when given one of these.
+    """
+    path: str
+
+
+def __partition_path(dataset_path, experiment_id):
+    return os.path.join(dataset_path, f'{PARTITION_COLUMN}={experiment_id}', PARTITION_FILE)
+
+
+def export_db(db_path, dataset_path, compression=DEFAULT_COMPRESSION):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from shared import generate_transmission_plots as gte
+    from shared.engines import create_readonly_engine
+    from shared.generate_transmission_plots import TABLE_NAME
+
+    engine = create_readonly_engine(db_path)
+    experiment_ids = pd.read_sql_query(f'SELECT DISTINCT experiment_id FROM {TABLE_NAME}', engine)
+
+    for experiment_id in experiment_ids['experiment_id']:
+        print(f'Exporting experiment {experiment_id}...')
+        data = pd.read_sql_query(f"""
+        SELECT * FROM {TABLE_NAME}
+        WHERE experiment_id = '{experiment_id}'
+        ORDER BY set_voltage, set_cavity_fb_att, frequency_hz
+        """, engine).drop(columns=PARTITION_COLUMN)
+
+        # Settings come from the same query as in __get_data_from_db; only constant ones leave the rows
+        settings = {column: value.item() if hasattr(value, 'item') else value
+                    for column, value in gte.__query_settings(engine, experiment_id).items()}
+        constant = [column for column in settings if data[column].nunique(dropna=False) == 1]
+        table = pa.Table.from_pandas(data.drop(columns=constant), preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               SETTINGS_METADATA_KEY: json.dumps(settings).encode()})
+
+        path = __partition_path(dataset_path, experiment_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, path, compression=compression, row_group_size=ROW_GROUP_SIZE)
+
+
+def experiment_ids(dataset):
+    prefix = f'{PARTITION_COLUMN}='
+    return [name[len(prefix):] for name in sorted(os.listdir(dataset.path)) if name.startswith(prefix)]
+
+
+def load_settings(dataset, experiment_id):
+    import pyarrow.parquet as pq
+
+    metadata = pq.read_schema(__partition_path(dataset.path, experiment_id)).metadata
+    return pd.Series(json.loads(metadata[SETTINGS_METADATA_KEY]), name=0)
+
+
+def load_grid(dataset, experiment_id, freq_min=1e9, freq_max=99e9, voltage_min=-2.0, voltage_max=2.0):
+    """
+    Parquet counterpart of __get_data_from_db; returns (power_grid, voltages, frequencies, settings).
+    """
+    import pyarrow.dataset as ds
+
+    # The partition path selects the experiment; the window is pushed down to the row-group statistics
+    partition = ds.dataset(__partition_path(dataset.path, experiment_id), format='parquet')
+    window = ((ds.field('set_voltage') >= voltage_min) & (ds.field('set_voltage') <= voltage_max)
+              & (ds.field('frequency_hz') >= freq_min) & (ds.field('frequency_hz') <= freq_max))
+    data = partition.to_table(columns=['frequency_hz', 'set_voltage', 'power_dBm'], filter=window)
+
+    power_grid, voltages, frequencies = build_grid(data['set_voltage'].to_numpy(),
+                                                   data['frequency_hz'].to_numpy(),
+                                                   data['power_dBm'].to_numpy())
+    return power_grid, voltages, frequencies, load_settings(dataset, experiment_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export an acquisition database to a partitioned Parquet dataset.')
+    parser.add_argument('db_path', help='path to the .db file')
+    parser.add_argument('dataset_path', help='output directory')
+    parser.add_argument('--compression', default=DEFAULT_COMPRESSION)
+    args = parser.parse_args()
+    export_db(args.db_path, args.dataset_path, args.compression)
+
+
+if __name__ == "__main__":
+    main()
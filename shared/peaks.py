@@ -0,0 +1,171 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks, peak_prominences
+# find_peaks' own distance selection, so rows selected here break ties exactly as find_peaks does
+from scipy.signal._peak_finding_utils import _select_by_peak_distance
+
+# One record per peak: the grid row (voltage/attenuation index), the frequency index and the power there
+PEAK_DTYPE = np.dtype([('row', np.int32), ('col', np.int32), ('power', np.float64)])
+
+
+def find_peaks_2d(power_grid, height=None, prominence=None, distance=None):
+    """
+    Finds the peaks of every row of power_grid in one batched find_peaks pass. The result is the same as
+    calling find_peaks(power_grid[row], height=height, prominence=prominence, distance=distance) row by row.
+
+    The rows are laid end to end with a NaN gap between them. find_peaks never compares across a NaN,
+    so no peak, plateau or prominence base reaches into the neighbouring row.
+    find_peaks filters by height, then distance, then prominence. The distance rule is greedy within a row
+    and its tie-breaking depends on the whole row, so it is applied row by row to the height candidates,
+    with scipy's own selection, in the rows where two candidates lie closer than `distance`; elsewhere it
+    would remove nothing. Prominence depends only on the signal around a peak, so it is computed once for
+    the peaks that are left.
+    height may also be an ndarray broadcasting against power_grid, e.g. per-row thresholds of shape
+    (n_rows, 1). Returns a PEAK_DTYPE array ordered by row, then column.
+    """
+    if distance is not None and distance < 1:
+        raise ValueError('`distance` must be greater or equal to 1')
+    grid = np.asarray(power_grid, dtype=np.float64)
+    n_rows, n_cols = grid.shape
+
+    padded = np.full((n_rows, n_cols + 1), np.nan)
+    padded[:, :n_cols] = grid
+    flat_height = height
+    if isinstance(height, np.ndarray):
+        # find_peaks takes one threshold per sample; the gap samples never hold a peak
+        padded_height = np.zeros_like(padded)
+        padded_height[:, :n_cols] = height
+        flat_height = padded_height.ravel()
+    flat_indices = __height_candidates(padded.ravel(), flat_height)
+
+    if distance is not None and flat_indices.size > 1:
+        flat_indices = __select_by_distance(flat_indices, padded, distance)
+    if prominence is not None:
+        prominences = peak_prominences(padded.ravel(), flat_indices)[0]
+        flat_indices = flat_indices[__within(prominences, prominence)]
+
+    rows, cols = np.divmod(flat_indices, n_cols + 1)
+    peaks = np.empty(rows.size, dtype=PEAK_DTYPE)
+    peaks['row'], peaks['col'] = rows, cols
+    peaks['power'] = grid[rows, cols]
+    return peaks
+
+
+def __height_candidates(flat, height):
+    # find_peaks(flat, height=height)[0], searched only among the samples at or above the lower height bound
+    # and their neighbours: a peak's plateau lies above the bound and find_peaks compares it only with the
+    # samples on either side. Runs of those samples are joined with NaN gaps, as the rows are
+    low = height[0] if isinstance(height, tuple) else height
+    if low is None:
+        return find_peaks(flat, height=height)[0]
+    above = flat >= low
+    near = above.copy()
+    near[1:] |= above[:-1]
+    near[:-1] |= above[1:]
+    selected = np.flatnonzero(near)
+    if selected.size == 0:
+        return selected
+    positions = np.arange(selected.size)
+    positions[1:] += np.cumsum(np.diff(selected) > 1)
+    compressed = np.full(positions[-1] + 1, np.nan)
+    compressed[positions] = flat[selected]
+    compressed_height = height
+    if isinstance(height, np.ndarray):
+        compressed_height = np.zeros_like(compressed)
+        compressed_height[positions] = height[selected]
+    origins = np.empty(compressed.size, dtype=np.intp)
+    origins[positions] = selected
+    return origins[find_peaks(compressed, height=compressed_height)[0]]
+
+
+def __select_by_distance(flat_indices, padded, distance):
+    # find_peaks' distance rule on each row that needs it: the same candidates and priorities find_peaks
+    # would pass, so ties between equal peaks break the same way
+    rows, cols = np.divmod(flat_indices, padded.shape[1])
+    close = (rows[1:] == rows[:-1]) & (np.diff(cols) < np.ceil(distance))
+    keep = np.ones(flat_indices.size, dtype=bool)
+    bounds = np.searchsorted(rows, np.unique(rows[1:][close]), side='left')
+    for start in bounds:
+        row = rows[start]
+        stop = np.searchsorted(rows, row, side='right')
+        row_cols = cols[start:stop]
+        keep[start:stop] = _select_by_peak_distance(row_cols, padded[row, row_cols], float(distance))
+    return flat_indices[keep]
+
+
+def __within(values, bounds):
+    # find_peaks' interval condition: a number is a lower bound, a pair is (min, max) with None for open
+    low, high = bounds if isinstance(bounds, (tuple, list)) else (bounds, None)
+    keep = np.ones(values.size, dtype=bool)
+    if low is not None:
+        keep &= low <= values
+    if high is not None:
+        keep &= values <= high
+    return keep
+
+
+def peaks_to_frame(peaks, row_values, frequencies, row_name):
+    """
+    Turns find_peaks_2d output into the peaks_df used by the figure scripts: row_name, peak_freq, peak_power.
+    """
+    return pd.DataFrame({row_name: np.asarray(row_values)[peaks['row']],
+                         'peak_freq': np.asarray(frequencies)[peaks['col']],
+                         'peak_power': peaks['power']})
+
+
+def peak_pool(jobs):
+    """
+    Process pool for find_peaks_many.
+    """
+    return ProcessPoolExecutor(max_workers=jobs)
+
+
+def __find_peaks_rows(block_name, shape, row_start, row_stop, kwargs):
+    # Runs in a pool worker: attaches to the parent's grid instead of receiving a pickled copy.
+    # The worker only closes its mapping; find_peaks_many, which created the block, unlinks it
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        grid = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        peaks = find_peaks_2d(grid[row_start:row_stop], **kwargs)
+        del grid
+    finally:
+        block.close()
+    peaks['row'] += row_start
+    return peaks
+
+
+def row_chunks(n_rows, chunks):
+    """
+    Splits range(n_rows) into at most `chunks` contiguous (start, stop) blocks of near-equal size.
+    """
+    bounds = np.linspace(0, n_rows, min(chunks, n_rows) + 1).round().astype(int)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def find_peaks_many(power_grids, executor, chunks=1, **kwargs):
+    """
+    find_peaks_2d for several grids on a pool from peak_pool. Each grid is copied once into shared
+    memory (the float64 copy find_peaks would make anyway) and split into `chunks` row blocks, so one
+    large grid can use several workers and many small grids are spread over the pool.
+    Returns one PEAK_DTYPE array per grid, identical to find_peaks_2d(grid, **kwargs).
+    """
+    blocks = []
+    try:
+        pending = []
+        for power_grid in power_grids:
+            shape = np.shape(power_grid)
+            block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+            blocks.append(block)
+            np.ndarray(shape, dtype=np.float64, buffer=block.buf)[...] = power_grid
+            pending.append([executor.submit(__find_peaks_rows, block.name, shape, start, stop, kwargs)
+                            for start, stop in row_chunks(shape[0], chunks)])
+        return [np.concatenate([future.result() for future in futures]) if futures
+                else np.empty(0, dtype=PEAK_DTYPE)
+                for futures in pending]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
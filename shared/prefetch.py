@@ -0,0 +1,54 @@
+import queue
+import threading
+
+# Queue message kinds
+__ITEM, __ERROR, __DONE = range(3)
+
+
+def prefetch(iterable, depth=1):
+    """
+    Iterates over iterable on a background thread while the caller works on the previous item.
+    At most depth items wait in the queue, so memory stays bounded at depth + 2 items
+    (queued, being produced, being consumed). depth=0 iterates in the calling thread.
+    Exceptions raised by the iterable are re-raised in the caller.
+    """
+    if depth <= 0:
+        yield from iterable
+        return
+
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(message):
+        # Give up if the consumer has gone away, instead of blocking forever on a full queue
+        while not stop.is_set():
+            try:
+                items.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((__ITEM, item)):
+                    return
+        except BaseException as error:
+            put((__ERROR, error))
+        else:
+            put((__DONE, None))
+
+    producer = threading.Thread(target=produce, name='prefetch', daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, payload = items.get()
+            if kind == __DONE:
+                break
+            if kind == __ERROR:
+                raise payload
+            yield payload
+    finally:
+        stop.set()
+        producer.join()
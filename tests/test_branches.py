@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from shared.branches import LOWER, MERGED, OTHER, UPPER, adjacent_differences, track_branches
+
+
+def peaks_frame(peaks):
+    rows, freqs = zip(*peaks)
+    return pd.DataFrame({'voltage': rows, 'peak_freq': freqs, 'peak_power': np.zeros(len(rows))})
+
+
+def coalescing_peaks(n_rows=30, merge_row=20, missing_lower=(), extra=()):
+    # Two branches closing in on 6.01 GHz, one peak per row from merge_row on
+    peaks = []
+    for row in range(n_rows):
+        if row < merge_row:
+            splitting = 0.02e9 * np.sqrt(1 - row / merge_row)
+            if row not in missing_lower:
+                peaks.append((row, 6.01e9 - splitting / 2))
+            peaks.append((row, 6.01e9 + splitting / 2))
+        else:
+            peaks.append((row, 6.01e9 + 1e5 * (row - merge_row)))
+    return peaks + list(extra)
+
+
+def labels_by_peak(branches):
+    return {(row, freq): label for row, freq, label in zip(branches.rows, branches.freqs, branches.branch)}
+
+
+def test_split_rows_are_labelled_by_track():
+    branches = track_branches(peaks_frame(coalescing_peaks()), 'voltage')
+    split = branches.rows < 20
+    assert (branches.branch[split] != MERGED).all()
+    np.testing.assert_array_equal(branches.lower()['voltage'], np.arange(20))
+    np.testing.assert_array_equal(branches.upper()['voltage'], np.arange(20))
+    np.testing.assert_array_equal(branches.merged()['voltage'], np.arange(20, 30))
+    assert branches.coalescence_row() == 20
+
+
+def test_row_with_a_missing_peak_keeps_its_branch():
+    peaks = coalescing_peaks(missing_lower=(5, 6))
+    branches = track_branches(peaks_frame(peaks), 'voltage')
+    labels = labels_by_peak(branches)
+    lone = [peak for peak in peaks if peak[0] in (5, 6)]
+    assert [labels[peak] for peak in lone] == [UPPER, UPPER]
+    assert MERGED not in branches.branch[branches.rows < 20]
+    assert branches.coalescence_row() == 20
+    # The lower branch is one track across the gap
+    assert np.unique(branches.track[branches.branch == LOWER]).size == 1
+
+
+def test_spurious_peak_is_other():
+    spurious = (10, 6.05e9)
+    branches = track_branches(peaks_frame(coalescing_peaks(extra=[spurious])), 'voltage')
+    labels = labels_by_peak(branches)
+    assert labels[spurious] == OTHER
+    assert (branches.upper()['voltage'].to_numpy() == np.arange(20)).all()
+
+
+def test_branch_leaving_the_window_is_not_merged():
+    # The lower branch stops at row 15 while the upper one carries on above it
+    peaks = [(row, 6.00e9) for row in range(15)] + [(row, 6.02e9 + 1e5 * row) for row in range(30)]
+    branches = track_branches(peaks_frame(peaks), 'voltage')
+    assert MERGED not in branches.branch
+    assert branches.coalescence_row() is None
+    np.testing.assert_array_equal(branches.upper()['voltage'], np.arange(30))
+
+
+def test_splittings_per_row():
+    branches = track_branches(peaks_frame(coalescing_peaks()), 'voltage')
+    rows, splittings = branches.splittings()
+    np.testing.assert_array_equal(rows, np.arange(20))
+    np.testing.assert_allclose(splittings, 0.02e9 * np.sqrt(1 - np.arange(20) / 20))
+
+
+def test_adjacent_differences_groups():
+    lower, diffs = adjacent_differences([np.array([0, 0, 1, 1, 1]), np.array([0, 0, 0, 0, 1])],
+                                        np.array([3.0, 1.0, 5.0, 2.0, 7.0]))
+    np.testing.assert_array_equal(lower, [1, 3])
+    np.testing.assert_array_equal(diffs, [2.0, 3.0])
+
+
+def test_loser_falls_back_to_next_free_peak():
+    # Three tracks bunched together: all of row 1 is closest to the middle peak of row 0, so two of them
+    # must fall back past it, one beyond the nearest peak on its other side
+    peaks = [(0, 6.000e9), (0, 6.004e9), (0, 6.008e9), (1, 6.0050e9), (1, 6.0055e9), (1, 6.0060e9)]
+    branches = track_branches(peaks_frame(peaks), 'voltage', max_gap=0)
+    assert np.unique(branches.track).size == 3
+    tracks = {tuple(freqs) for _, freqs in branches.tracks()}
+    assert tracks == {(6.004e9, 6.0050e9), (6.008e9, 6.0060e9), (6.000e9, 6.0055e9)}
+
+
+def test_crossing_tracks_stay_continuous():
+    # Two branches crossing, plus a third close to the crossing: every track keeps one peak per row
+    rows = np.arange(21)
+    peaks = ([(row, 6.000e9 + row * 1e6) for row in rows] + [(row, 6.0205e9 - row * 1e6) for row in rows]
+             + [(row, 6.0095e9 + (row % 2) * 2e5) for row in rows])
+    branches = track_branches(peaks_frame(peaks), 'voltage', max_jump=2e6, max_gap=0)
+    assert np.unique(branches.track).size == 3
+    for track_rows, _ in branches.tracks():
+        np.testing.assert_array_equal(track_rows, rows)
@@ -0,0 +1,45 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from shared import generate_transmission_plots as gte, parquet_store
+from shared.engines import create_readonly_engine
+
+pytest.importorskip('pyarrow')
+
+
+def make_db(path):
+    con = sqlite3.connect(path)
+    con.execute(f"CREATE TABLE {gte.TABLE_NAME} (experiment_id TEXT, frequency_hz REAL, set_voltage REAL, "
+                f"power_dBm REAL, {', '.join(f'{column} REAL' for column in gte.SETTINGS_COLUMNS)})")
+    rng = np.random.default_rng(0)
+    rows = []
+    for experiment_id in ['a', 'b']:
+        # Written from high to low voltage, with the cavity feedback attenuation changing halfway, so the
+        # first row in voltage order carries different settings from the first row of the table
+        for voltage in [0.5, 0.25, 0.0, -0.25, -0.5]:
+            for frequency in np.linspace(5.9e9, 6.1e9, 8):
+                settings = [10.0, 15.0, 3.0, 0.0, 5.0 if voltage > 0 else 4.0, 180.0, 2.0]
+                rows.append((experiment_id, frequency, voltage, rng.normal(), *settings))
+    con.executemany(f'INSERT INTO {gte.TABLE_NAME} VALUES ({", ".join("?" * 11)})', rows)
+    con.commit()
+    con.close()
+
+
+def test_settings_match_the_sqlite_loader(tmp_path):
+    db_path = tmp_path / 'test.db'
+    make_db(db_path)
+    dataset_path = tmp_path / 'test.parquet'
+    parquet_store.export_db(str(db_path), str(dataset_path))
+
+    engine = create_readonly_engine(str(db_path))
+    dataset = parquet_store.ParquetDataset(str(dataset_path))
+    for experiment_id in ['a', 'b']:
+        sql_grid, sql_voltages, sql_frequencies, sql_settings = gte.__get_data_from_db(engine, experiment_id,
+                                                                                      use_cache=False)
+        grid, voltages, frequencies, settings = gte.__get_data_from_db(dataset, experiment_id)
+        assert settings.to_dict() == sql_settings.to_dict()
+        np.testing.assert_array_equal(grid, sql_grid)
+        np.testing.assert_array_equal(voltages, sql_voltages)
+        np.testing.assert_array_equal(frequencies, sql_frequencies)
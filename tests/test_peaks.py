@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from scipy.signal import find_peaks
+
+from shared.bench_peaks import PEAK_KWARGS, noisy_lorentzian_grid
+from shared.peaks import find_peaks_2d, find_peaks_many, peak_pool
+
+
+def per_row_peaks(grid, height=None, prominence=None, distance=None):
+    rows, cols = [], []
+    for row in range(grid.shape[0]):
+        row_height = np.broadcast_to(height, grid.shape)[row] if isinstance(height, np.ndarray) else height
+        found, _ = find_peaks(grid[row], height=row_height, prominence=prominence, distance=distance)
+        rows.extend([row] * found.size)
+        cols.extend(found)
+    return np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+
+def assert_same_peaks(peaks, grid, expected):
+    rows, cols = expected
+    np.testing.assert_array_equal(peaks['row'], rows)
+    np.testing.assert_array_equal(peaks['col'], cols)
+    np.testing.assert_array_equal(peaks['power'], grid[rows, cols])
+
+
+def noisy_grid(seed, shape=(60, 200), nan_fraction=0.0, decimals=None):
+    rng = np.random.default_rng(seed)
+    columns = np.arange(shape[1])
+    centers = rng.uniform(0, shape[1], size=(shape[0], 3))
+    grid = (np.exp(-((columns - centers[..., None]) / 4.0) ** 2).sum(axis=1) * 10 - 10
+            + rng.normal(scale=0.3, size=shape))
+    if decimals is not None:
+        # Coarse quantization makes equal neighbouring samples and equal peak heights common
+        grid = np.round(grid, decimals)
+    grid[rng.random(shape) < nan_fraction] = np.nan
+    return grid
+
+
+@pytest.mark.parametrize('kwargs', [
+    dict(),
+    dict(height=-7),
+    dict(height=-7, prominence=0.025),
+    dict(height=-7, prominence=0.025, distance=10),
+    dict(prominence=0.5, distance=3),
+    dict(distance=1),
+    dict(distance=2.5),
+    dict(height=(-7, -2), prominence=(0.025, None), distance=3),
+])
+@pytest.mark.parametrize('decimals', [None, 0, 1])
+@pytest.mark.parametrize('nan_fraction', [0.0, 0.02])
+def test_matches_per_row_find_peaks(kwargs, decimals, nan_fraction):
+    grid = noisy_grid(1, nan_fraction=nan_fraction, decimals=decimals)
+    assert_same_peaks(find_peaks_2d(grid, **kwargs), grid, per_row_peaks(grid, **kwargs))
+
+
+def test_distance_ties():
+    # Equal peaks closer than distance: which one survives is decided within the row alone
+    grid = np.zeros((4, 30))
+    grid[:, [5, 8, 11, 20, 23]] = 1
+    grid[1, 8] = 2
+    grid[2, :] = np.nan
+    assert_same_peaks(find_peaks_2d(grid, distance=5), grid, per_row_peaks(grid, distance=5))
+
+
+def test_noisy_lorentzians():
+    # Most rows hold noise maxima closer than distance, as in the measured grids
+    grid = noisy_lorentzian_grid(40, 1500, noise=0.05)
+    assert_same_peaks(find_peaks_2d(grid, **PEAK_KWARGS), grid, per_row_peaks(grid, **PEAK_KWARGS))
+
+
+def test_distance_below_one():
+    with pytest.raises(ValueError):
+        find_peaks_2d(np.zeros((2, 10)), distance=0.5)
+
+
+def test_per_row_height():
+    grid = noisy_grid(2, nan_fraction=0.01, decimals=1)
+    height = np.nanmax(grid, axis=1, keepdims=True) - 2
+    assert_same_peaks(find_peaks_2d(grid, height=height, distance=5), grid,
+                      per_row_peaks(grid, height=height, distance=5))
+
+
+def test_find_peaks_many_matches_find_peaks_2d():
+    grids = [noisy_grid(seed, shape=(25, 120), nan_fraction=0.01, decimals=1) for seed in range(3)]
+    kwargs = dict(height=-7, prominence=0.025, distance=10)
+    with peak_pool(2) as pool:
+        results = find_peaks_many(grids, pool, chunks=3, **kwargs)
+    for grid, peaks in zip(grids, results):
+        np.testing.assert_array_equal(peaks, find_peaks_2d(grid, **kwargs))
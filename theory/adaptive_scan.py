@@ -0,0 +1,196 @@
+"""
+Adaptive peak scan of a theory map, as a cheaper stand-in for the dense scan of frame_A/frame_B
+(find_peaks on every row of compute_photon_numbers_NR/_PT with a height of 10% of the row maximum).
+
+Rows are first evaluated every row_step rows of the dense sweep, and an interval between two evaluated
+rows is bisected until its ends have the same number of peaks at positions within position_tol of each
+other. Rows inside an accepted interval get interpolated peak positions, snapped to the w_f grid.
+Within a row, every col_step-th w_f point is evaluated, and the full-resolution points are evaluated
+only around each coarse maximum: over its flat top (coarse points within FLAT_TOP_FRACTION of it) and
+one coarse step beyond. The true maxima lie there as long as the peaks are wider than a coarse step,
+so the row maximum and the peaks are those of the dense row.
+
+    python -m theory.adaptive_scan
+"""
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.signal import find_peaks
+
+from theory import dimer_model_numeric as nm
+
+HEIGHT_FRACTION = nm.PEAK_HEIGHT_FRACTION
+
+# Coarse points within this fraction of a coarse maximum count as part of its peak top
+FLAT_TOP_FRACTION = 0.05
+
+
+@dataclass
+class PeakScan:
+    """
+    Peaks on every row of the dense sweep; rows that were not evaluated hold interpolated positions.
+    peak_freqs is NaN-padded to the largest number of peaks in a row.
+    """
+    row_vals: np.ndarray
+    w_f_vals: np.ndarray
+    peak_freqs: np.ndarray
+    counts: np.ndarray
+    evaluated: np.ndarray
+    evaluations: int
+
+    def splittings(self):
+        """
+        Rows with exactly two peaks and their splitting; returns (row values, splittings).
+        """
+        split = self.counts == 2
+        return self.row_vals[split], np.abs(self.peak_freqs[split, 1] - self.peak_freqs[split, 0])
+
+    def first_single_peak(self):
+        """
+        The first row value (in sweep order) with a single peak, or None.
+        """
+        single = np.flatnonzero(self.counts == 1)
+        return self.row_vals[single[0]] if single.size else None
+
+    def tracks(self):
+        """
+        All peaks as flat (row values, peak frequencies) arrays, like the scatter data of the frames.
+        """
+        rows, slots = np.nonzero(~np.isnan(self.peak_freqs))
+        return self.row_vals[rows], self.peak_freqs[rows, slots]
+
+
+def __scan_row(ss_response_func, row_val, w_f_vals, col_step, height_fraction):
+    # Returns (peak column indices, number of evaluated points) for one row
+    n_cols = w_f_vals.size
+    coarse = np.unique(np.r_[np.arange(0, n_cols, col_step), n_cols - 1])
+    row = np.full(n_cols, np.nan)
+    row[coarse] = np.abs(ss_response_func(row_val, w_f_vals[coarse])) ** 2
+
+    # Every coarse local maximum (and a maximum at either edge) brackets the true maxima near it
+    coarse_vals = row[coarse]
+    padded = np.r_[-np.inf, coarse_vals, -np.inf]
+    maxima = np.flatnonzero((padded[1:-1] >= padded[:-2]) & (padded[1:-1] >= padded[2:]))
+    dense = np.zeros(n_cols, dtype=bool)
+    for idx in maxima:
+        # Near coalescence two peaks share one flat top that the coarse points cannot split, so the
+        # window covers the whole top, then one coarse step on either side
+        low = high = idx
+        while low > 0 and coarse_vals[low - 1] >= coarse_vals[idx] * (1 - FLAT_TOP_FRACTION):
+            low -= 1
+        while high < coarse.size - 1 and coarse_vals[high + 1] >= coarse_vals[idx] * (1 - FLAT_TOP_FRACTION):
+            high += 1
+        dense[coarse[max(low - 1, 0)]:coarse[min(high + 1, coarse.size - 1)] + 1] = True
+    dense[coarse] = False
+    dense_cols = np.flatnonzero(dense)
+    row[dense_cols] = np.abs(ss_response_func(row_val, w_f_vals[dense_cols])) ** 2
+
+    # NaN gaps keep find_peaks from reporting maxima of the coarse-only stretches
+    peaks, _ = find_peaks(row, height=np.nanmax(row) * height_fraction)
+    return peaks, coarse.size + dense_cols.size
+
+
+def __rows_agree(peaks_a, peaks_b, position_tol):
+    return peaks_a.size == peaks_b.size and (peaks_a.size == 0 or np.max(np.abs(peaks_a - peaks_b)) <= position_tol)
+
+
+def adaptive_peak_scan(ss_response_func, row_vals, w_f_vals, row_step=16, col_step=8, position_tol=None,
+                       height_fraction=HEIGHT_FRACTION):
+    """
+    ss_response_func(row_val, w_f) is a response from dimer_model_numeric.response_NR/_PT.
+    position_tol is in w_f units; the default of two w_f grid steps keeps interpolated peaks within
+    about a grid step of the dense scan.
+    """
+    row_vals = np.asarray(row_vals, dtype=float)
+    w_f_vals = np.asarray(w_f_vals, dtype=float)
+    n_rows = row_vals.size
+    if position_tol is None:
+        position_tol = 2 * np.abs(w_f_vals[1] - w_f_vals[0]) if w_f_vals.size > 1 else 0.0
+
+    found = {}
+    evaluations = 0
+
+    def evaluate(index):
+        nonlocal evaluations
+        peaks, points = __scan_row(ss_response_func, row_vals[index], w_f_vals, col_step, height_fraction)
+        found[index] = w_f_vals[peaks]
+        evaluations += points
+
+    for index in np.unique(np.r_[np.arange(0, n_rows, row_step), n_rows - 1]):
+        evaluate(index)
+
+    # Bisect every interval whose ends disagree until they agree or are neighbours
+    pending = sorted(found)
+    intervals = list(zip(pending[:-1], pending[1:]))
+    while intervals:
+        next_intervals = []
+        for low, high in intervals:
+            if high - low > 1 and not __rows_agree(found[low], found[high], position_tol):
+                middle = (low + high) // 2
+                evaluate(middle)
+                next_intervals += [(low, middle), (middle, high)]
+        intervals = next_intervals
+
+    # Fill the rows in between from their evaluated neighbours
+    max_peaks = max((peaks.size for peaks in found.values()), default=0)
+    peak_freqs = np.full((n_rows, max_peaks), np.nan)
+    counts = np.zeros(n_rows, dtype=int)
+    evaluated = np.zeros(n_rows, dtype=bool)
+    indices = sorted(found)
+    for low, high in zip(indices[:-1], indices[1:]):
+        peaks_low, peaks_high = found[low], found[high]
+        if high - low > 1 and peaks_low.size == peaks_high.size and peaks_low.size:
+            weight = ((np.arange(low + 1, high) - low) / (high - low))[:, None]
+            interpolated = peaks_low + weight * (peaks_high - peaks_low)
+            # Snap to the w_f grid, as a dense scan would report
+            snapped = np.abs(interpolated[..., None] - w_f_vals).argmin(axis=-1)
+            peak_freqs[low + 1:high, :peaks_low.size] = w_f_vals[snapped]
+            counts[low + 1:high] = peaks_low.size
+    for index, peaks in found.items():
+        peak_freqs[index] = np.nan
+        peak_freqs[index, :peaks.size] = peaks
+        counts[index] = peaks.size
+        evaluated[index] = True
+
+    return PeakScan(row_vals, w_f_vals, peak_freqs, counts, evaluated, evaluations)
+
+
+def __dense_scan(ss_response_func, row_vals, w_f_vals, height_fraction=HEIGHT_FRACTION):
+    # The frames' scan: every row, every w_f point
+    counts, first_single, splittings = [], None, []
+    W, F = np.meshgrid(row_vals, w_f_vals, indexing='ij')
+    photon_numbers = np.abs(ss_response_func(W, F)) ** 2
+    for row_val, row in zip(row_vals, photon_numbers):
+        peaks, _ = find_peaks(row, height=np.max(row) * height_fraction)
+        counts.append(peaks.size)
+        if peaks.size == 1 and first_single is None:
+            first_single = row_val
+        if peaks.size == 2:
+            splittings.append(abs(w_f_vals[peaks[1]] - w_f_vals[peaks[0]]))
+    return np.array(counts), first_single, np.array(splittings)
+
+
+# Compares the adaptive scan with the dense scan on the figure 2 parameter sets
+if __name__ == "__main__":
+    lo_freqs = np.linspace(5.6, 6.4, 1000)
+    cases = [
+        ('NR', nm.response_NR, np.linspace(5.6, 5.9, 1000),
+         dict(gamma_vec=np.array([0.025, 0.025]), drive_vector=np.array([1, 1]), readout_vector=np.array([1, 1]),
+              phi_val=np.pi), [0.06, 0.07, 0.08, 0.09]),
+        ('PT', nm.response_PT, np.linspace(0.15, 0.3, 1000),
+         dict(gamma_vec=np.array([0.04, 0.04]), drive_vector=np.array([1, 0]), readout_vector=np.array([1, 0]),
+              phi_val=0), [0.075, 0.08, 0.085, 0.09]),
+    ]
+    for name, get_response, sweep, settings, J_vals in cases:
+        for J_val in J_vals:
+            params = nm.ModelParams(J_val=J_val, g_val=0.025 - 0.04, cavity_freq=6.0, w_y=6.0, **settings)
+            response = get_response(params)
+            scan = adaptive_peak_scan(response, sweep, lo_freqs)
+            counts, first_single, splittings = __dense_scan(response, sweep, lo_freqs)
+            _, adaptive_splittings = scan.splittings()
+            same_counts = np.array_equal(counts, scan.counts)
+            max_error = (np.max(np.abs(adaptive_splittings - splittings))
+                         if same_counts and splittings.size else float('nan'))
+            print(f'{name} J={J_val:.3f}: {scan.evaluations / (sweep.size * lo_freqs.size):.1%} of the evaluations, '
+                  f'first single peak {scan.first_single_peak()} (dense {first_single}), '
+                  f'peak counts identical: {same_counts}, max splitting error {max_error:.2g}')
@@ -0,0 +1,220 @@
+"""
+Numeric N-mode generalization of the two-cavity model, for chains and rings of coupled modes.
+
+With the complex adjacency matrix A, mode frequencies w0 and linewidths gamma, the dynamics matrix is
+
+    M = i A - diag(gamma / 2) - i diag(w0 - w_f),
+
+exactly as in theory.dimer_model_symbolics for two modes, and the response is r . M^-1 F. No symbolic
+inversion is involved: steady_state solves one complex N x N system per point, in batches with
+np.linalg.solve, and the response of a single swept mode parameter needs only one batch of solves
+per distinct w_f.
+
+    modes = chain(5, J=0.06, w0=6.0, gamma=0.025)
+    response = get_steady_state_response(modes, 'w0', mode=4)
+    photon_numbers = compute_photon_numbers(response, yig_freqs, lo_freqs)
+
+The two-mode NR/PT models are CoupledModes.from_model_params(params), swept in 'w0' or 'gamma' of mode 1.
+
+    python -m theory.coupled_modes
+"""
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from theory.dimer_model_numeric import DEFAULT_SWEEP_MAX_BYTES, ModelParams
+
+# Mode parameters get_steady_state_response can sweep
+MODE_PARAMETERS = ('w0', 'gamma')
+
+
+@dataclass
+class CoupledModes:
+    """
+    adjacency: complex (N, N) coupling matrix; entry [i, j] couples mode j into mode i
+    w0, gamma: mode frequencies and linewidths, shape (N,)
+    drive, readout: drive vector F and readout vector r, shape (N,)
+    """
+    adjacency: np.ndarray
+    w0: np.ndarray
+    gamma: np.ndarray
+    drive: np.ndarray
+    readout: np.ndarray
+
+    @property
+    def n_modes(self):
+        return self.adjacency.shape[0]
+
+    @classmethod
+    def from_model_params(cls, params: ModelParams):
+        """
+        The two-cavity model of ModelParams: mode 0 is the cavity, mode 1 the YIG.
+        """
+        adjacency = np.array([[0, np.exp(1j * params.phi_val) * params.J_val],
+                              [params.J_val, 0]], dtype=complex)
+        return cls(adjacency, np.array([params.cavity_freq, params.w_y], dtype=float),
+                   np.asarray(params.gamma_vec, dtype=float), np.asarray(params.drive_vector, dtype=complex),
+                   np.asarray(params.readout_vector, dtype=complex))
+
+    def dynamics_matrix(self, w_f, w0=None, gamma=None):
+        """
+        M for every point of the broadcast of w_f (...) with w0, gamma (..., N); shape (..., N, N).
+        """
+        w0 = self.w0 if w0 is None else w0
+        gamma = self.gamma if gamma is None else gamma
+        diagonal = -np.asarray(gamma) / 2 - 1j * (np.asarray(w0) - np.asarray(w_f)[..., None])
+        matrix = np.broadcast_to(1j * self.adjacency, diagonal.shape[:-1] + self.adjacency.shape).copy()
+        modes = np.arange(self.n_modes)
+        matrix[..., modes, modes] += diagonal
+        return matrix
+
+    def eigenfrequencies(self, w0=None, gamma=None):
+        """
+        Complex eigenfrequencies of the effective Hamiltonian i M + w_f, sorted by real part; shape (..., N).
+        """
+        hamiltonian = 1j * self.dynamics_matrix(0.0, w0, gamma)
+        eigenvalues = np.linalg.eigvals(hamiltonian)
+        return np.take_along_axis(eigenvalues, np.argsort(eigenvalues.real, axis=-1), axis=-1)
+
+
+def __mode_vector(value, n_modes, dtype=float):
+    return np.broadcast_to(np.asarray(value, dtype=dtype), (n_modes,)).copy()
+
+
+def __unit_vector(n_modes, mode):
+    vector = np.zeros(n_modes, dtype=complex)
+    vector[mode] = 1
+    return vector
+
+
+def chain(n_modes, J, w0, gamma, phi=0.0, drive=None, readout=None):
+    """
+    Open chain with nearest-neighbour coupling J. As in the two-cavity model, entry [k, k + 1] carries
+    the phase e^{i phi} and entry [k + 1, k] is J. w0 and gamma are scalars or per-mode arrays; drive and
+    readout default to the first mode.
+    """
+    adjacency = np.zeros((n_modes, n_modes), dtype=complex)
+    bonds = np.arange(n_modes - 1)
+    adjacency[bonds, bonds + 1] = np.exp(1j * phi) * np.asarray(J)
+    adjacency[bonds + 1, bonds] = J
+    return CoupledModes(adjacency, __mode_vector(w0, n_modes), __mode_vector(gamma, n_modes),
+                        __unit_vector(n_modes, 0) if drive is None else __mode_vector(drive, n_modes, complex),
+                        __unit_vector(n_modes, 0) if readout is None else __mode_vector(readout, n_modes, complex))
+
+
+def ring(n_modes, J, w0, gamma, phi=0.0, drive=None, readout=None):
+    """
+    chain() closed by a bond from the last mode back to the first, with the same phase convention.
+    """
+    modes = chain(n_modes, J, w0, gamma, phi, drive, readout)
+    if n_modes > 2:
+        modes.adjacency[n_modes - 1, 0] = np.exp(1j * phi) * np.asarray(J)
+        modes.adjacency[0, n_modes - 1] = J
+    return modes
+
+
+def __bytes_per_point(n_modes):
+    # The matrix, its LU copy inside solve, and a few vectors, all complex128
+    return 16 * (3 * n_modes * n_modes + 4 * n_modes)
+
+
+def steady_state(modes: CoupledModes, w_f, w0=None, gamma=None, max_bytes=DEFAULT_SWEEP_MAX_BYTES):
+    """
+    Mode amplitudes x = M^-1 F for every point of the broadcast of w_f (...) with w0, gamma (..., N);
+    returns shape (..., N). The points are solved in chunks that keep the temporaries under max_bytes.
+    """
+    n_modes = modes.n_modes
+    w0 = np.asarray(modes.w0 if w0 is None else w0, dtype=float)
+    gamma = np.asarray(modes.gamma if gamma is None else gamma, dtype=float)
+    w_f = np.asarray(w_f, dtype=float)
+    shape = np.broadcast_shapes(w_f.shape, w0.shape[:-1], gamma.shape[:-1])
+
+    flat_w_f = np.broadcast_to(w_f, shape).reshape(-1)
+    flat_w0 = np.broadcast_to(w0, shape + (n_modes,)).reshape(-1, n_modes)
+    flat_gamma = np.broadcast_to(gamma, shape + (n_modes,)).reshape(-1, n_modes)
+    drive = modes.drive.astype(complex)[:, None]
+
+    chunk = max(int(max_bytes // __bytes_per_point(n_modes)), 1)
+    amplitudes = np.empty((flat_w_f.size, n_modes), dtype=complex)
+    for start in range(0, flat_w_f.size, chunk):
+        part = slice(start, start + chunk)
+        matrix = modes.dynamics_matrix(flat_w_f[part], flat_w0[part], flat_gamma[part])
+        rhs = np.broadcast_to(drive, (matrix.shape[0], n_modes, 1))
+        amplitudes[part] = np.linalg.solve(matrix, rhs)[..., 0]
+    return amplitudes.reshape(shape + (n_modes,))
+
+
+def get_steady_state_response(modes: CoupledModes, parameter='w0', mode=-1, max_bytes=DEFAULT_SWEEP_MAX_BYTES):
+    """
+    Returns f(values, w_f), the response r . x with `parameter` ('w0' or 'gamma') of `mode` set to values.
+    values and w_f broadcast, so f works with compute_photon_numbers_NR/_PT and theory.adaptive_scan.
+
+    Changing one mode parameter adds delta e_k e_k^T to the dynamics matrix B of the base model, so
+    only B is solved, once per distinct w_f (for F and for e_k), and every point follows from the
+    Sherman-Morrison update r . x = r . B^-1 F - delta (r . B^-1 e_k) (B^-1 F)_k / (1 + delta (B^-1 e_k)_k).
+    """
+    if parameter not in MODE_PARAMETERS:
+        raise ValueError(f'parameter must be one of {MODE_PARAMETERS}')
+    n_modes = modes.n_modes
+    mode = range(n_modes)[mode]
+    base = getattr(modes, parameter)[mode]
+    rhs = np.stack([modes.drive.astype(complex), __unit_vector(n_modes, mode)], axis=-1)
+
+    def response(values, w_f):
+        values, w_f = np.broadcast_arrays(np.asarray(values, dtype=float), np.asarray(w_f, dtype=float))
+        unique_w_f, inverse = np.unique(w_f, return_inverse=True)
+        inverse = inverse.reshape(w_f.shape)
+
+        # B^-1 [F, e_k] for every distinct w_f, in chunks
+        chunk = max(int(max_bytes // __bytes_per_point(n_modes)), 1)
+        solved = np.empty((unique_w_f.size, n_modes, 2), dtype=complex)
+        for start in range(0, unique_w_f.size, chunk):
+            matrix = modes.dynamics_matrix(unique_w_f[start:start + chunk])
+            solved[start:start + chunk] = np.linalg.solve(matrix, np.broadcast_to(rhs, (matrix.shape[0],) + rhs.shape))
+        base_response = (solved[..., 0] @ modes.readout)[inverse]
+        readout_of_unit = (solved[..., 1] @ modes.readout)[inverse]
+        driven_k = solved[:, mode, 0][inverse]
+        unit_k = solved[:, mode, 1][inverse]
+
+        delta = -1j * (values - base) if parameter == 'w0' else -(values - base) / 2
+        return base_response - delta * readout_of_unit * driven_k / (1 + delta * unit_k)
+
+    return response
+
+
+def compute_photon_numbers(ss_response_func, values, w_f_vals):
+    """
+    Photon numbers |r . x|^2 on the (values, w_f_vals) grid, like compute_photon_numbers_NR/_PT.
+    """
+    V, W_F = np.meshgrid(values, w_f_vals, indexing='ij')
+    return np.abs(ss_response_func(V, W_F)) ** 2
+
+
+# Checks the two-mode special cases against the closed form, then times a 10-mode ring
+if __name__ == "__main__":
+    from theory import dimer_model_numeric as nm
+
+    lo_freqs = np.linspace(5.6, 6.4, 1000)
+    nr = nm.ModelParams(J_val=0.06, g_val=0.025 - 0.04, cavity_freq=6.0, w_y=6.0,
+                        gamma_vec=np.array([0.025, 0.025]), drive_vector=np.array([1, 1]),
+                        readout_vector=np.array([1, 1]), phi_val=np.pi)
+    pt = nm.ModelParams(J_val=0.075, g_val=0.025 - 0.04, cavity_freq=6.0, w_y=6.0,
+                        gamma_vec=np.array([0.04, 0.04]), drive_vector=np.array([1, 0]),
+                        readout_vector=np.array([1, 0]), phi_val=0)
+    for name, params, parameter, get_response, sweep in [
+            ('NR', nr, 'w0', nm.response_NR, np.linspace(5.6, 5.9, 1000)),
+            ('PT', pt, 'gamma', nm.response_PT, np.linspace(0.15, 0.3, 1000))]:
+        start = time.perf_counter()
+        modes = CoupledModes.from_model_params(params)
+        photon_numbers = compute_photon_numbers(get_steady_state_response(modes, parameter, mode=1), sweep, lo_freqs)
+        elapsed = time.perf_counter() - start
+        reference = compute_photon_numbers(get_response(params), sweep, lo_freqs)
+        max_rel_diff = np.max(np.abs(photon_numbers - reference) / reference)
+        print(f'{name}: max relative difference to the closed form {max_rel_diff:.2e}, {elapsed:.2f} s')
+
+    modes = ring(10, J=0.06, w0=6.0, gamma=0.025, phi=np.pi / 10)
+    start = time.perf_counter()
+    photon_numbers = compute_photon_numbers(get_steady_state_response(modes, 'w0', mode=5),
+                                            np.linspace(5.6, 6.4, 1000), lo_freqs)
+    print(f'10-mode ring, 1000 x 1000 grid: {time.perf_counter() - start:.2f} s')
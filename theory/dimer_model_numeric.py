@@ -0,0 +1,276 @@
+"""
+Numpy backend for the two-cavity steady state, without sympy.
+
+The dynamics matrix of theory.dimer_model_symbolics,
+
+    M = [[-gamma_1/2 - i(w_c1 - w_f),  i e^{i phi} J            ],
+         [i J,                         -gamma_2/2 - i(w_c2 - w_f)]],
+
+is inverted in closed form, so the steady state M^-1 F is evaluated elementwise over any
+broadcastable parameter arrays. Compare against the sympy backend with
+
+    python -m theory.dimer_model_numeric
+"""
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from shared.peaks import PEAK_DTYPE, find_peaks_2d
+
+BACKENDS = ('numeric', 'sympy')
+
+# Parameters sweep_photon_numbers can scan, in the order of the steady_state arguments they feed
+SWEEP_AXES = ('w_f', 'cavity_freq', 'w_y', 'gamma_1', 'gam_y', 'J', 'phi', 'g')
+
+# Working memory of one sweep chunk; each point needs roughly this many bytes of temporaries
+DEFAULT_SWEEP_MAX_BYTES = 256 * 1024 ** 2
+SWEEP_BYTES_PER_POINT = 256
+
+# The figure 2 frames keep peaks above this fraction of the row maximum
+PEAK_HEIGHT_FRACTION = 0.1
+
+
+@dataclass(frozen=True)
+class ModelParams:
+    """
+    Frozen and hashable, so it can key caches: the vectors are stored as tuples of floats.
+    """
+    J_val: float
+    g_val: float
+    cavity_freq: float
+    w_y: float
+    gamma_vec: tuple
+    drive_vector: tuple
+    readout_vector: tuple
+    phi_val: float
+
+    def __post_init__(self):
+        for name in ('gamma_vec', 'drive_vector', 'readout_vector'):
+            object.__setattr__(self, name, tuple(np.asarray(getattr(self, name)).tolist()))
+
+
+def steady_state(w_f, w_c1, w_c2, gamma_1, gamma_2, J, phi_val, F1, F2):
+    """
+    Returns the cavity amplitudes (x1, x2) = M^-1 F; all arguments broadcast against each other.
+    """
+    w_f = np.asarray(w_f)
+    m11 = -np.asarray(gamma_1) / 2 - 1j * (w_c1 - w_f)
+    m12 = 1j * np.exp(1j * np.asarray(phi_val)) * J
+    m21 = 1j * np.asarray(J)
+    m22 = -np.asarray(gamma_2) / 2 - 1j * (w_c2 - w_f)
+    det = m11 * m22 - m12 * m21
+    return (m22 * F1 - m12 * F2) / det, (m11 * F2 - m21 * F1) / det
+
+
+def response(params: ModelParams, w_f, **overrides):
+    """
+    Readout-weighted steady state r . x at the drive frequencies w_f. Any of w_y, gam_y, J, phi,
+    cavity_freq may be given as arrays in overrides to sweep it instead of using the value in params.
+    """
+    x1, x2 = steady_state(w_f,
+                          overrides.get('cavity_freq', params.cavity_freq),
+                          overrides.get('w_y', params.w_y),
+                          params.gamma_vec[0],
+                          overrides.get('gam_y', params.gamma_vec[1]),
+                          overrides.get('J', params.J_val),
+                          overrides.get('phi', params.phi_val),
+                          params.drive_vector[0], params.drive_vector[1])
+    return params.readout_vector[0] * x1 + params.readout_vector[1] * x2
+
+
+def __steady_state_kernel(backend):
+    if backend == 'sympy':
+        from theory import dimer_model_symbolics as sm
+        return sm.steady_state_function()
+    return steady_state
+
+
+def sweep_photon_numbers(params: ModelParams, max_bytes=DEFAULT_SWEEP_MAX_BYTES, backend='numeric', **axes):
+    """
+    Photon numbers |r . x|^2 over the outer product of the swept axes, in one call:
+
+        sweep_photon_numbers(params, J=J_vals, phi=phi_vals, w_y=yig_freqs, w_f=lo_freqs)
+
+    returns an array of shape (len(J_vals), len(phi_vals), len(yig_freqs), len(lo_freqs)), with the axes
+    in keyword order. Any of SWEEP_AXES may be swept and the rest come from params. The model does not
+    depend on g, so a g axis only repeats the same values. The work is split into chunks of the flattened
+    sweep so that temporaries stay under max_bytes whatever the sweep size.
+    """
+    unknown = set(axes) - set(SWEEP_AXES)
+    if unknown:
+        raise ValueError(f'Cannot sweep {sorted(unknown)}; sweepable parameters are {SWEEP_AXES}')
+    names = list(axes)
+    values = [np.asarray(axes[name]).ravel() for name in names]
+    shape = tuple(value.size for value in values)
+    kernel = __steady_state_kernel(backend)
+
+    defaults = {'w_f': None, 'cavity_freq': params.cavity_freq, 'w_y': params.w_y, 'gamma_1': params.gamma_vec[0],
+                'gam_y': params.gamma_vec[1], 'J': params.J_val, 'phi': params.phi_val}
+    if 'w_f' not in axes:
+        raise ValueError('w_f must be swept')
+
+    # A chunk is a slice of one axis times the whole of every later axis, so each parameter enters as a
+    # broadcast view instead of being gathered point by point. Earlier axes are looped over.
+    chunk = max(int(max_bytes // SWEEP_BYTES_PER_POINT), 1)
+    sliced_axis, trailing = len(shape) - 1, 1
+    while sliced_axis > 0 and trailing * shape[sliced_axis] <= chunk:
+        trailing *= shape[sliced_axis]
+        sliced_axis -= 1
+    step = max(chunk // trailing, 1)
+
+    photon_numbers = np.empty(shape)
+    for outer in np.ndindex(*shape[:sliced_axis]):
+        for start in range(0, shape[sliced_axis], step):
+            point = dict(defaults)
+            for axis, (name, value) in enumerate(zip(names, values)):
+                if axis < sliced_axis:
+                    point[name] = value[outer[axis]]
+                else:
+                    part = value[start:start + step] if axis == sliced_axis else value
+                    point[name] = part.reshape((-1,) + (1,) * (len(shape) - 1 - axis))
+            x1, x2 = kernel(point['w_f'], point['cavity_freq'], point['w_y'], point['gamma_1'], point['gam_y'],
+                            point['J'], point['phi'], params.drive_vector[0], params.drive_vector[1])
+            photon_numbers[outer + (slice(start, start + step),)] = np.abs(
+                params.readout_vector[0] * x1 + params.readout_vector[1] * x2) ** 2
+    return photon_numbers
+
+
+def response_NR(params: ModelParams, backend='numeric'):
+    """
+    Returns f(w_y, w_f), the steady-state response for the non-PT symmetric case.
+    backend='sympy' returns the lambdified response of theory.dimer_model_symbolics instead.
+    """
+    if backend == 'sympy':
+        from theory import dimer_model_symbolics as sm
+        return sm.get_steady_state_response_NR(sm.setup_symbolic_equations(), params)
+    return lambda w_y, w_f: response(params, w_f, w_y=w_y)
+
+
+def response_PT(params: ModelParams, backend='numeric'):
+    """
+    Returns f(gam_y, w_f), the steady-state response for the PT symmetric case.
+    backend='sympy' returns the lambdified response of theory.dimer_model_symbolics instead.
+    """
+    if backend == 'sympy':
+        from theory import dimer_model_symbolics as sm
+        return sm.get_steady_state_response_PT(sm.setup_symbolic_equations(), params)
+    return lambda gam_y, w_f: response(params, w_f, gam_y=gam_y)
+
+
+def compute_photon_numbers_NR(ss_response_func, w_y_vals, w_f_vals):
+    """
+    Computes the photon numbers for the non-PT symmetric case.
+    ss_response_func: steady-state response function from response_NR
+    w_y_vals: array of YIG frequencies
+    w_f_vals: array of LO frequencies
+    Returns a 2D array of photon numbers.
+    """
+    W_Y, W_F = np.meshgrid(w_y_vals, w_f_vals, indexing='ij')
+    photon_numbers_complex = ss_response_func(W_Y, W_F)
+    photon_numbers_real = np.abs(photon_numbers_complex) ** 2
+    return photon_numbers_real
+
+
+def compute_photon_numbers_PT(ss_response_func, gam_y_vals, w_f_vals):
+    """
+    Computes the photon numbers for the PT symmetric case.
+    ss_response_func: steady-state response function from response_PT
+    gam_y_vals: array of gamma_y values
+    w_f_vals: array of LO frequencies
+    Returns a 2D array of photon numbers.
+    """
+    GAM_Y, W_F = np.meshgrid(gam_y_vals, w_f_vals, indexing='ij')
+    photon_numbers_complex = ss_response_func(GAM_Y, W_F)
+    photon_numbers_real = np.abs(photon_numbers_complex) ** 2
+    return photon_numbers_real
+
+
+def __reduce_max(block, row_start):
+    return block.max(axis=1)
+
+
+def __reduce_peaks(block, row_start):
+    peaks = find_peaks_2d(block, height=block.max(axis=1, keepdims=True) * PEAK_HEIGHT_FRACTION)
+    peaks['row'] += row_start
+    return peaks
+
+
+def peak_splittings(peaks, w_f_vals, n_rows):
+    """
+    From 'peaks' records: the w_f distance between the two peaks of every row that has exactly two, NaN
+    elsewhere, and the number of peaks per row. Returns (splittings, counts), both of shape (n_rows,).
+    """
+    counts = np.bincount(peaks['row'], minlength=n_rows)
+    splittings = np.full(n_rows, np.nan)
+    two = np.flatnonzero(counts == 2)
+    # Records are ordered by row, then column
+    first = np.searchsorted(peaks['row'], two)
+    w_f_vals = np.asarray(w_f_vals)
+    splittings[two] = np.abs(w_f_vals[peaks['col'][first + 1]] - w_f_vals[peaks['col'][first]])
+    return splittings, counts
+
+
+# Row reducers of evaluate_photon_numbers: reducer(block, row_start) -> one result per block, concatenated
+REDUCERS = {
+    'max': __reduce_max,
+    'peaks': __reduce_peaks,
+}
+
+
+def evaluate_photon_numbers(ss_response_func, row_vals, w_f_vals, reducer=None, max_bytes=DEFAULT_SWEEP_MAX_BYTES):
+    """
+    Photon numbers |ss_response_func(row, w_f)|^2 on the (row_vals, w_f_vals) grid, evaluated in blocks of
+    whole rows so that no block needs more than max_bytes of temporaries. With reducer=None the full map is
+    returned, as from compute_photon_numbers_NR/_PT. Otherwise each block is reduced as soon as it is
+    computed and only the reductions are kept:
+
+        'max'        the row maximum, shape (n_rows,)
+        'peaks'      PEAK_DTYPE records of find_peaks on every row with a height of PEAK_HEIGHT_FRACTION of
+                     the row maximum, as in frame_A/frame_B; 'row' and 'col' index row_vals and w_f_vals
+        'splitting'  the 'peaks' reduction passed through peak_splittings: the w_f distance between the
+                     peaks of rows with exactly two of them, NaN elsewhere
+
+    reducer may also be a callable reducer(block, row_start) returning an array per block.
+    """
+    row_vals = np.asarray(row_vals)
+    w_f_vals = np.asarray(w_f_vals)
+    reduce_block = REDUCERS['peaks' if reducer == 'splitting' else reducer] if isinstance(reducer, str) else reducer
+    rows_per_block = max(int(max_bytes // (SWEEP_BYTES_PER_POINT * max(w_f_vals.size, 1))), 1)
+
+    results = []
+    for row_start in range(0, row_vals.size, rows_per_block):
+        block_rows = row_vals[row_start:row_start + rows_per_block]
+        block = np.abs(ss_response_func(block_rows[:, None], w_f_vals[None, :])) ** 2
+        results.append(block if reduce_block is None else reduce_block(block, row_start))
+
+    if reducer is None:
+        return np.concatenate(results) if results else np.empty((0, w_f_vals.size))
+    if reducer in ('peaks', 'splitting'):
+        peaks = np.concatenate(results) if results else np.empty(0, dtype=PEAK_DTYPE)
+        return peak_splittings(peaks, w_f_vals, row_vals.size)[0] if reducer == 'splitting' else peaks
+    return np.concatenate(results) if results else np.empty(0)
+
+
+# Compares both backends on the figure 2 parameter sets
+if __name__ == "__main__":
+    lo_freqs = np.linspace(5.6, 6.4, 1000)
+    cases = [
+        ('NR', response_NR, compute_photon_numbers_NR, np.linspace(5.6, 5.9, 1000),
+         dict(gamma_vec=np.array([0.025, 0.025]), drive_vector=np.array([1, 1]), readout_vector=np.array([1, 1]),
+              phi_val=np.pi), [0.06, 0.07, 0.08, 0.09]),
+        ('PT', response_PT, compute_photon_numbers_PT, np.linspace(0.15, 0.3, 1000),
+         dict(gamma_vec=np.array([0.04, 0.04]), drive_vector=np.array([1, 0]), readout_vector=np.array([1, 0]),
+              phi_val=0), [0.075, 0.08, 0.085, 0.09]),
+    ]
+    for name, get_response, compute_photon_numbers, sweep, settings, J_vals in cases:
+        for J_val in J_vals:
+            params = ModelParams(J_val=J_val, g_val=0.025 - 0.04, cavity_freq=6.0, w_y=6.0, **settings)
+            results = {}
+            for backend in BACKENDS:
+                start = time.perf_counter()
+                results[backend] = compute_photon_numbers(get_response(params, backend=backend), sweep, lo_freqs)
+                results[backend + '_time'] = time.perf_counter() - start
+            max_rel_diff = np.max(np.abs(results['numeric'] - results['sympy']) / np.abs(results['sympy']))
+            print(f'{name} J={J_val:.3f}: max relative difference {max_rel_diff:.2e}, '
+                  f'numeric {results["numeric_time"]:.3f} s, sympy {results["sympy_time"]:.3f} s')
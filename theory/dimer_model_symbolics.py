@@ -1,6 +1,23 @@
+import functools
+import hashlib
+import importlib.util
+import inspect
+import os
+import uuid
 from dataclasses import dataclass
 import numpy as np
 import sympy as sp
+from sympy.printing.numpy import NumPyPrinter
+
+# The parameters, the photon-number helpers and the sweeps are shared with the numpy backend
+from theory.dimer_model_numeric import ModelParams, compute_photon_numbers_NR, compute_photon_numbers_PT, \
+    sweep_photon_numbers
+
+# Generated modules holding the simplified steady state, one per model definition and sympy version
+GENERATED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_generated')
+
+# Argument order of the generated steady_state function
+STEADY_STATE_ARGS = ('w_f', 'w_c1', 'w_c2', 'gamma_1', 'gamma_2', 'J', 'phi_val', 'F1', 'F2')
 
 
 @dataclass
@@ -17,23 +34,7 @@ class ModelSymbolics:
     steady_state_eqns: sp.Expr
 
 
-@dataclass
-class ModelParams:
-    J_val: float
-    g_val: float
-    cavity_freq: float
-    w_y: float
-    gamma_vec: np.ndarray
-    drive_vector: np.ndarray
-    readout_vector: np.ndarray
-    phi_val: float
-
-
-def setup_symbolic_equations() -> ModelSymbolics:
-    """
-    Sets up the symbolic steady-state equations for the two-cavity system.
-    Returns the symbolic variables and the steady-state equations.
-    """
+def __define_symbols():
     # Symbolic variables
     J, w_f, w_y, gam_y, g = sp.symbols('J w_f w_y gam_y g', real=True)
     w_c1, w_c2 = sp.symbols('w_c1 w_c2', real=True)
@@ -42,9 +43,12 @@ def setup_symbolic_equations() -> ModelSymbolics:
     gamma = sp.Matrix([gam_1, gam_2])
     F1, F2 = sp.symbols('F1 F2')
     F = sp.Matrix([F1, F2])
+    phi_val = sp.symbols('phi_val', real=True)
+    return J, w_f, w_y, gam_y, g, w0, gamma, F, phi_val
+
 
+def __derive_steady_state(J, w_f, w0, gamma, F, phi_val):
     # Define the adjacency matrix with phase factor
-    phi_val = sp.symbols('phi_val', real=True)
     cavity_adj_matrix = sp.Matrix([
         [0, sp.exp(1j * phi_val) * J],
         [J, 0]
@@ -67,15 +71,109 @@ def setup_symbolic_equations() -> ModelSymbolics:
 
     # Steady-state equations
     steady_state_eqns = cavity_dynamics_matrix.inv() * F
-    steady_state_eqns_simplified = sp.simplify(steady_state_eqns)
+    return sp.simplify(steady_state_eqns)
+
+
+def __model_hash():
+    # Any edit to the model definition, or a different sympy, yields a new generated module
+    source = inspect.getsource(__define_symbols) + inspect.getsource(__derive_steady_state)
+    return hashlib.sha1(f'{source}|{sp.__version__}'.encode()).hexdigest()[:16]
+
+
+def __generated_path():
+    return os.path.join(GENERATED_DIR, f'dimer_model_{__model_hash()}.py')
+
+
+def __write_generated_module(path, steady_state_eqns):
+    printer = NumPyPrinter()
+    lines = [
+        '# Generated by theory.dimer_model_symbolics from the model definition. Do not edit.',
+        'import numpy',
+        '',
+        f'STEADY_STATE_SREPR = {[sp.srepr(eqn) for eqn in steady_state_eqns]!r}',
+        '',
+        '',
+        f'def steady_state({", ".join(STEADY_STATE_ARGS)}):',
+        *[f'    x{i + 1} = {printer.doprint(eqn)}' for i, eqn in enumerate(steady_state_eqns)],
+        '    return x1, x2',
+        '',
+    ]
+    os.makedirs(GENERATED_DIR, exist_ok=True)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines))
+    os.replace(tmp_path, path)
+
+
+@functools.lru_cache(maxsize=None)
+def __generated_module():
+    """
+    Imports the generated module for the current model, deriving and writing it first if needed.
+    """
+    path = __generated_path()
+    if not os.path.exists(path):
+        J, w_f, w_y, gam_y, g, w0, gamma, F, phi_val = __define_symbols()
+        steady_state_eqns = __derive_steady_state(J, w_f, w0, gamma, F, phi_val)
+        __write_generated_module(path, steady_state_eqns)
+    spec = importlib.util.spec_from_file_location(f'theory._generated.{os.path.basename(path)[:-3]}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@functools.lru_cache(maxsize=None)
+def setup_symbolic_equations() -> ModelSymbolics:
+    """
+    Sets up the symbolic steady-state equations for the two-cavity system.
+    Returns the symbolic variables and the steady-state equations.
+    The simplified equations are derived once and then read back from the generated module.
+    """
+    J, w_f, w_y, gam_y, g, w0, gamma, F, phi_val = __define_symbols()
+    steady_state_eqns = sp.Matrix([sp.sympify(eqn) for eqn in __generated_module().STEADY_STATE_SREPR])
+    return ModelSymbolics(J, w_f, w_y, gam_y, g, w0, gamma, F, phi_val, steady_state_eqns)
+
+
+def steady_state_function():
+    """
+    Returns the numpy steady state steady_state(w_f, w_c1, w_c2, gamma_1, gamma_2, J, phi_val, F1, F2) -> (x1, x2).
+    """
+    return __generated_module().steady_state
 
-    return ModelSymbolics(J, w_f, w_y, gam_y, g, w0, gamma, F, phi_val, steady_state_eqns_simplified)
+
+@functools.lru_cache(maxsize=None)
+def __cached_response_function(variable, cavity_freq, w_y, J_val, gamma_vec, drive_vector, readout_vector, phi_val):
+    steady_state = steady_state_function()
+    gamma_1, gamma_2 = gamma_vec
+    F1, F2 = drive_vector
+    r1, r2 = readout_vector
+
+    if variable == 'w_y':
+        def response(w_y_vals, w_f):
+            x1, x2 = steady_state(w_f, cavity_freq, w_y_vals, gamma_1, gamma_2, J_val, phi_val, F1, F2)
+            return r1 * x1 + r2 * x2
+    else:
+        def response(gam_y_vals, w_f):
+            x1, x2 = steady_state(w_f, cavity_freq, w_y, gamma_1, gam_y_vals, J_val, phi_val, F1, F2)
+            return r1 * x1 + r2 * x2
+    return response
+
+
+def __response_function(params, variable):
+    # The swept variable's own value in params does not matter, so it is left out of the cache key
+    return __cached_response_function(variable, float(params.cavity_freq),
+                                      float(params.w_y) if variable == 'gam_y' else None,
+                                      float(params.J_val), params.gamma_vec, params.drive_vector,
+                                      params.readout_vector, float(params.phi_val))
 
 
 def get_steady_state_response_NR(symbols_dict: ModelSymbolics, params: ModelParams) -> sp.Expr:
     """
     Returns a function that computes the steady-state response for the non-PT symmetric case.
     """
+    if symbols_dict is setup_symbolic_equations():
+        # Standard model: evaluate the generated steady state instead of substituting and lambdifying
+        return __response_function(params, 'w_y')
+
     # Unpack symbols
     w0 = symbols_dict.w0
     gamma = symbols_dict.gamma
@@ -107,6 +205,9 @@ def get_steady_state_response_PT(symbols_dict: ModelSymbolics, params: ModelPara
     """
     Returns a function that computes the steady-state response for the PT symmetric case.
     """
+    if symbols_dict is setup_symbolic_equations():
+        return __response_function(params, 'gam_y')
+
     # Unpack symbols
     w0 = symbols_dict.w0
     gamma = symbols_dict.gamma
@@ -134,34 +235,6 @@ def get_steady_state_response_PT(symbols_dict: ModelSymbolics, params: ModelPara
     return sp.lambdify((symbols_dict.gam_y, symbols_dict.w_f), ss_eqn, 'numpy')
 
 
-def compute_photon_numbers_NR(ss_response_func, w_y_vals, w_f_vals):
-    """
-    Computes the photon numbers for the non-PT symmetric case.
-    ss_response_func: steady-state response function from get_steady_state_response_non_PT
-    w_y_vals: array of YIG frequencies
-    w_f_vals: array of LO frequencies
-    Returns a 2D array of photon numbers.
-    """
-    W_Y, W_F = np.meshgrid(w_y_vals, w_f_vals, indexing='ij')
-    photon_numbers_complex = ss_response_func(W_Y, W_F)
-    photon_numbers_real = np.abs(photon_numbers_complex) ** 2
-    return photon_numbers_real
-
-
-def compute_photon_numbers_PT(ss_response_func, gam_y_vals, w_f_vals):
-    """
-    Computes the photon numbers for the PT symmetric case.
-    ss_response_func: steady-state response function from get_steady_state_response_PT
-    gam_y_vals: array of gamma_y values
-    w_f_vals: array of LO frequencies
-    Returns a 2D array of photon numbers.
-    """
-    GAM_Y, W_F = np.meshgrid(gam_y_vals, w_f_vals, indexing='ij')
-    photon_numbers_complex = ss_response_func(GAM_Y, W_F)
-    photon_numbers_real = np.abs(photon_numbers_complex) ** 2
-    return photon_numbers_real
-
-
 # Example usage
 if __name__ == "__main__":
     # Setup symbolic equations
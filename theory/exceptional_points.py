@@ -0,0 +1,123 @@
+"""
+Exceptional points of the two-cavity model, straight from the dynamics matrix.
+
+With M the dynamics matrix of theory.dimer_model_numeric, the effective Hamiltonian H = iM + w_f
+has the eigenfrequencies
+
+    w_(+/-) = (w_c1 + w_c2)/2 - i(gamma_1 + gamma_2)/4 +/- sqrt(D^2 + J^2 e^{i phi}),
+    D = (w_c1 - w_c2)/2 - i(gamma_1 - gamma_2)/4.
+
+They coalesce where the discriminant D^2 + J^2 e^{i phi} vanishes, i.e. D = +/- i J e^{i phi/2}.
+The real part fixes w_c2 = w_c1 +/- 2 J sin(phi/2), the imaginary part gamma_2 = gamma_1 +/- 4 J cos(phi/2).
+Solving for one of w_y (= w_c2) or gam_y (= gamma_2) leaves the other condition as a residual: the
+EP exists, for the given fixed parameters, only where the residual is zero.
+
+    python -m theory.exceptional_points
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+from theory.dimer_model_numeric import ModelParams
+
+EP_VARIABLES = ('w_y', 'gam_y')
+
+
+@dataclass
+class ExceptionalPoints:
+    """
+    EP candidates for a batch of parameter sets. The last axis holds the two sign choices.
+    location: value of the variable at the EP
+    residual: how far the other (fixed) parameter is from satisfying the EP condition; 0 at a true EP
+    frequency: the coalesced complex eigenfrequency there
+    """
+    variable: str
+    location: np.ndarray
+    residual: np.ndarray
+    frequency: np.ndarray
+
+    def exists(self, tol=1e-12):
+        return np.abs(self.residual) <= tol
+
+    def nearest(self, reference):
+        """
+        The candidate closest to reference (e.g. the middle of a sweep) for every parameter set.
+        """
+        choice = np.argmin(np.abs(self.location - np.asarray(reference)[..., None]), axis=-1)
+        return np.take_along_axis(self.location, choice[..., None], axis=-1)[..., 0]
+
+
+def discriminant(w_c1, w_c2, gamma_1, gamma_2, J, phi):
+    detuning = (np.asarray(w_c1) - w_c2) / 2 - 1j * (np.asarray(gamma_1) - gamma_2) / 4
+    return detuning ** 2 + np.asarray(J) ** 2 * np.exp(1j * np.asarray(phi))
+
+
+def eigenvalues(w_c1, w_c2, gamma_1, gamma_2, J, phi):
+    """
+    Complex eigenfrequencies (lower, upper) of the two-cavity model, ordered by real part; all
+    arguments broadcast.
+    """
+    mean = (np.asarray(w_c1) + w_c2) / 2 - 1j * (np.asarray(gamma_1) + gamma_2) / 4
+    root = np.sqrt(discriminant(w_c1, w_c2, gamma_1, gamma_2, J, phi))
+    root = np.where(root.real < 0, -root, root)
+    return mean - root, mean + root
+
+
+def __model_arguments(params, overrides):
+    return dict(w_c1=overrides.get('cavity_freq', params.cavity_freq),
+                w_c2=overrides.get('w_y', params.w_y),
+                gamma_1=overrides.get('gamma_1', params.gamma_vec[0]),
+                gamma_2=overrides.get('gam_y', params.gamma_vec[1]),
+                J=overrides.get('J', params.J_val),
+                phi=overrides.get('phi', params.phi_val))
+
+
+def eigenvalue_branches(params: ModelParams, **overrides):
+    """
+    eigenvalues() for params with any of cavity_freq, w_y, gamma_1, gam_y, J, phi replaced by arrays,
+    e.g. eigenvalue_branches(params, w_y=yig_freqs) for the two branches along a YIG sweep.
+    """
+    return eigenvalues(**__model_arguments(params, overrides))
+
+
+def locate_ep(params: ModelParams, variable='w_y', **overrides):
+    """
+    Solves the discriminant for variable ('w_y' or 'gam_y') in closed form, for every parameter set
+    given by broadcasting the overrides (any of cavity_freq, w_y, gamma_1, gam_y, J, phi).
+    """
+    if variable not in EP_VARIABLES:
+        raise ValueError(f'variable must be one of {EP_VARIABLES}')
+    args = __model_arguments(params, overrides)
+    w_c1, w_c2 = np.asarray(args['w_c1'], dtype=float), np.asarray(args['w_c2'], dtype=float)
+    gamma_1, gamma_2 = np.asarray(args['gamma_1'], dtype=float), np.asarray(args['gamma_2'], dtype=float)
+    J, phi = np.asarray(args['J'], dtype=float), np.asarray(args['phi'], dtype=float)
+
+    # D at the EP, for both signs of the square root
+    sign = np.array([1.0, -1.0])
+    detuning = sign * (1j * J[..., None] * np.exp(1j * phi[..., None] / 2))
+
+    if variable == 'w_y':
+        location = w_c1[..., None] - 2 * detuning.real
+        residual = -(gamma_1 - gamma_2)[..., None] / 4 - detuning.imag
+        w_c2, gamma_2 = location, gamma_2[..., None]
+    else:
+        location = gamma_1[..., None] + 4 * detuning.imag
+        residual = (w_c1 - w_c2)[..., None] / 2 - detuning.real
+        w_c2, gamma_2 = w_c2[..., None], location
+
+    frequency = (w_c1[..., None] + w_c2) / 2 - 1j * (gamma_1[..., None] + gamma_2) / 4
+    location, residual, frequency = np.broadcast_arrays(location, residual, frequency)
+    return ExceptionalPoints(variable, location, residual, frequency)
+
+
+# EPs for the figure 2 parameter sets
+if __name__ == "__main__":
+    nr = ModelParams(J_val=0.06, g_val=0.025 - 0.04, cavity_freq=6.0, w_y=6.0, gamma_vec=np.array([0.025, 0.025]),
+                     drive_vector=np.array([1, 1]), readout_vector=np.array([1, 1]), phi_val=np.pi)
+    pt = ModelParams(J_val=0.075, g_val=0.025 - 0.04, cavity_freq=6.0, w_y=6.0, gamma_vec=np.array([0.04, 0.04]),
+                     drive_vector=np.array([1, 0]), readout_vector=np.array([1, 0]), phi_val=0)
+    for name, params, variable, J_vals in [('NR', nr, 'w_y', [0.06, 0.07, 0.08, 0.09]),
+                                           ('PT', pt, 'gam_y', [0.075, 0.08, 0.085, 0.09])]:
+        eps = locate_ep(params, variable, J=J_vals)
+        for J_val, location, exists in zip(J_vals, eps.location, eps.exists()):
+            print(f'{name} J={J_val:.3f}: {variable} at EP = {location[exists]}')
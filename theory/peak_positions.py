@@ -0,0 +1,193 @@
+"""
+Exact peak positions of |R(w_f)|^2 for a batch of w_y or gam_y values, without sampling w_f.
+
+Both cavity amplitudes share the denominator det M, which is quadratic in w_f, while the readout-weighted
+numerator is linear, so |R|^2 = P / Q with P real quadratic and Q real quartic. Its stationary points are
+the real roots of the degree-5 polynomial S = P'Q - PQ'. The roots of every row are the eigenvalues of
+one batch of companion matrices, and the maxima are the roots where S changes sign from + to -. As in
+frame_A/frame_B, a peak must lie strictly inside the w_f window and reach PEAK_HEIGHT_FRACTION of the
+largest |R|^2 in the window.
+
+To keep the companion matrices well conditioned, w_f is mapped onto u in [-1, 1] across the window.
+
+    peaks = analytic_peaks(params, 'w_y', yig_freqs, (lo_freqs[0], lo_freqs[-1]))
+    peaks.freqs, peaks.counts, peaks.splittings()
+
+    python -m theory.peak_positions
+"""
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from theory import dimer_model_numeric as nm
+
+PEAK_VARIABLES = ('w_y', 'gam_y')
+
+# |R|^2 has at most three maxima: S has five roots, and maxima and minima alternate
+MAX_PEAKS = 3
+
+# Roots with a smaller imaginary part (in units of the half-window) count as real
+REAL_ROOT_TOL = 1e-7
+
+
+@dataclass
+class RowPeaks:
+    """
+    Peaks of every row, sorted by frequency and NaN-padded to MAX_PEAKS.
+    """
+    values: np.ndarray
+    freqs: np.ndarray
+    heights: np.ndarray
+    counts: np.ndarray
+
+    def splittings(self):
+        """
+        w_f distance between the peaks of rows with exactly two of them, NaN elsewhere.
+        """
+        return np.where(self.counts == 2, self.freqs[:, 1] - self.freqs[:, 0], np.nan)
+
+    def first_single_peak(self):
+        """
+        Index of the first row with a single peak, or None.
+        """
+        single = np.flatnonzero(self.counts == 1)
+        return single[0] if single.size else None
+
+
+def sampled_peaks(peak_records, values, w_f_vals):
+    """
+    RowPeaks from the 'peaks' reduction of dimer_model_numeric.evaluate_photon_numbers on a sampled grid.
+    """
+    values = np.asarray(values)
+    rows = peak_records['row']
+    counts = np.bincount(rows, minlength=values.size)
+    slots = np.arange(rows.size) - np.searchsorted(rows, rows)
+    width = max(MAX_PEAKS, counts.max(initial=0))
+    freqs = np.full((values.size, width), np.nan)
+    heights = np.full((values.size, width), np.nan)
+    freqs[rows, slots] = np.asarray(w_f_vals)[peak_records['col']]
+    heights[rows, slots] = peak_records['power']
+    return RowPeaks(values, freqs, heights, counts)
+
+
+def __poly_mul(a, b):
+    # Products of polynomials in ascending coefficients along the last axis, for a batch of rows
+    out = np.zeros(np.broadcast_shapes(a.shape[:-1], b.shape[:-1]) + (a.shape[-1] + b.shape[-1] - 1,),
+                   dtype=np.result_type(a, b))
+    for i in range(a.shape[-1]):
+        out[..., i:i + b.shape[-1]] += a[..., i:i + 1] * b
+    return out
+
+
+def __poly_der(a):
+    return a[..., 1:] * np.arange(1, a.shape[-1])
+
+
+def __poly_val(a, u):
+    result = np.zeros(np.broadcast_shapes(a.shape[:-1], u.shape[:-1]) + u.shape[-1:], dtype=np.result_type(a, u))
+    for k in range(a.shape[-1] - 1, -1, -1):
+        result = result * u + a[..., k:k + 1]
+    return result
+
+
+def __roots(coefficients):
+    """
+    All roots of every row of ascending real coefficients, NaN-padded to the full degree. Rows whose
+    leading coefficients vanish are solved at their lower degree.
+    """
+    n_rows, size = coefficients.shape
+    scale = np.max(np.abs(coefficients), axis=1, keepdims=True)
+    significant = np.abs(coefficients) > 1e-12 * np.where(scale > 0, scale, 1)
+    degrees = np.where(significant.any(axis=1), size - 1 - np.argmax(significant[:, ::-1], axis=1), 0)
+
+    roots = np.full((n_rows, size - 1), np.nan, dtype=complex)
+    for degree in np.unique(degrees):
+        if degree == 0:
+            continue
+        rows = np.flatnonzero(degrees == degree)
+        monic = coefficients[rows, :degree] / coefficients[rows, degree:degree + 1]
+        companion = np.zeros((rows.size, degree, degree))
+        companion[:, np.arange(1, degree), np.arange(degree - 1)] = 1
+        companion[:, :, -1] = -monic
+        roots[rows, :degree] = np.linalg.eigvals(companion)
+    return roots
+
+
+def analytic_peaks(params: nm.ModelParams, variable, values, w_f_window, height_fraction=nm.PEAK_HEIGHT_FRACTION):
+    """
+    Peaks of |R(w_f)|^2 inside w_f_window = (w_min, w_max) for every value of variable ('w_y' for the NR
+    response, 'gam_y' for the PT response), with the other parameters from params.
+    """
+    if variable not in PEAK_VARIABLES:
+        raise ValueError(f'variable must be one of {PEAK_VARIABLES}')
+    values = np.asarray(values, dtype=float).ravel()
+    w_min, w_max = float(min(w_f_window)), float(max(w_f_window))
+    center, half_width = (w_min + w_max) / 2, (w_max - w_min) / 2
+
+    # Dynamics matrix entries with w_f = center + half_width * u; the diagonal gains i * half_width * u
+    w_y = values if variable == 'w_y' else np.full(values.size, float(params.w_y))
+    gamma_2 = values if variable == 'gam_y' else np.full(values.size, params.gamma_vec[1])
+    a1 = -params.gamma_vec[0] / 2 - 1j * (params.cavity_freq - center)
+    a2 = -gamma_2 / 2 - 1j * (w_y - center)
+    m12 = 1j * np.exp(1j * params.phi_val) * params.J_val
+    m21 = 1j * params.J_val
+    t = 1j * half_width
+    F1, F2 = params.drive_vector
+    r1, r2 = params.readout_vector
+
+    # R = N(u) / D(u): N = r . adj(M) F is linear, D = det M quadratic
+    numerator = np.stack([r1 * F1 * a2 - r1 * F2 * m12 + r2 * F2 * a1 - r2 * F1 * m21,
+                          np.full(values.size, t * (r1 * F1 + r2 * F2))], axis=-1)
+    denominator = np.stack([a1 * a2 - m12 * m21, t * (a1 + a2), np.full(values.size, t * t)], axis=-1)
+    P = __poly_mul(numerator, np.conj(numerator)).real
+    Q = __poly_mul(denominator, np.conj(denominator)).real
+    S = __poly_mul(__poly_der(P), Q) - __poly_mul(P, __poly_der(Q))
+
+    roots = __roots(S)
+    real = np.abs(roots.imag) <= REAL_ROOT_TOL
+    u = np.where(real, roots.real, np.nan)
+    inside = (u > -1) & (u < 1)
+    maxima = inside & (__poly_val(__poly_der(S), np.nan_to_num(u)) < 0)
+
+    heights = __poly_val(P, np.nan_to_num(u)) / __poly_val(Q, np.nan_to_num(u))
+    edges = __poly_val(P, np.array([-1.0, 1.0])) / __poly_val(Q, np.array([-1.0, 1.0]))
+    window_max = np.maximum(np.max(np.where(maxima, heights, -np.inf), axis=1), edges.max(axis=1))
+    keep = maxima & (heights >= height_fraction * window_max[:, None])
+
+    # Sort the kept peaks to the front by frequency and pad with NaN
+    u_kept = np.where(keep, u, np.inf)
+    order = np.argsort(u_kept, axis=1)[:, :MAX_PEAKS]
+    u_sorted = np.take_along_axis(u_kept, order, axis=1)
+    found = np.isfinite(u_sorted)
+    freqs = np.where(found, center + half_width * u_sorted, np.nan)
+    heights = np.where(found, np.take_along_axis(heights, order, axis=1), np.nan)
+    return RowPeaks(values, freqs, heights, found.sum(axis=1))
+
+
+# Compares the analytic peaks with find_peaks on the dense grid of the figure 2 frames
+if __name__ == "__main__":
+    lo_freqs = np.linspace(5.6, 6.4, 1000)
+    step = lo_freqs[1] - lo_freqs[0]
+    cases = [
+        ('NR', 'w_y', nm.response_NR, np.linspace(5.6, 5.9, 1000),
+         dict(gamma_vec=np.array([0.025, 0.025]), drive_vector=np.array([1, 1]), readout_vector=np.array([1, 1]),
+              phi_val=np.pi), [0.06, 0.07, 0.08, 0.09]),
+        ('PT', 'gam_y', nm.response_PT, np.linspace(0.15, 0.3, 1000),
+         dict(gamma_vec=np.array([0.04, 0.04]), drive_vector=np.array([1, 0]), readout_vector=np.array([1, 0]),
+              phi_val=0), [0.075, 0.08, 0.085, 0.09]),
+    ]
+    for name, variable, get_response, sweep, settings, J_vals in cases:
+        for J_val in J_vals:
+            params = nm.ModelParams(J_val=J_val, g_val=0.025 - 0.04, cavity_freq=6.0, w_y=6.0, **settings)
+            start = time.perf_counter()
+            peaks = analytic_peaks(params, variable, sweep, (lo_freqs[0], lo_freqs[-1]))
+            elapsed = time.perf_counter() - start
+            grid = sampled_peaks(nm.evaluate_photon_numbers(get_response(params), sweep, lo_freqs, reducer='peaks'),
+                                 sweep, lo_freqs)
+
+            same = peaks.counts == grid.counts
+            offsets = np.abs(peaks.freqs[same] - grid.freqs[same, :MAX_PEAKS])
+            print(f'{name} J={J_val:.3f}: {elapsed * 1e3:.1f} ms, {np.count_nonzero(~same)} rows with another count, '
+                  f'max offset from the grid peak {np.nanmax(offsets) / step:.2f} steps, first single peak row '
+                  f'{peaks.first_single_peak()} (grid {grid.first_single_peak()})')
@@ -0,0 +1,144 @@
+"""
+Memoized theory maps, keyed by (ModelParams, swept variable, grid, reducer, backend).
+
+A photon-number map, or its 'max'/'peaks'/'splitting' reduction from
+dimer_model_numeric.evaluate_photon_numbers, is computed once per key and then served from an
+in-process LRU limited to max_bytes. With cache_dir set, results are also written there as .npz
+files, so later figure builds skip the evaluation. The disk tier is capped at disk_max_bytes and evicted
+least-recently-used like the grid cache. Keys include a hash of the model and peak-finding source,
+so editing either never serves stale maps.
+
+    peaks = cached_photon_numbers(params, 'w_y', yig_freqs, lo_freqs, reducer='peaks')
+"""
+import functools
+import hashlib
+import os
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from shared import grid_cache
+from theory import dimer_model_numeric as nm
+
+# Disk tier next to the grid cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', '.theory_cache')
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+DEFAULT_DISK_MAX_BYTES = 2 * 1024 ** 3
+
+RESPONSE_GETTERS = {
+    'w_y': nm.response_NR,
+    'gam_y': nm.response_PT,
+}
+
+# Source files whose edits change the cached results
+__SOURCE_FILES = ('theory/dimer_model_numeric.py', 'theory/dimer_model_symbolics.py', 'shared/peaks.py')
+
+# In-process tier: key -> read-only array, most recently used last
+__memory = OrderedDict()
+__memory_bytes = 0
+
+
+@functools.lru_cache(maxsize=None)
+def __code_version():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha1()
+    for path in __SOURCE_FILES:
+        with open(os.path.join(root, path), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def grid_spec(values):
+    """
+    Hashable description of a grid: its length and a digest of its float64 values.
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    return values.size, hashlib.sha1(values.tobytes()).hexdigest()
+
+
+@functools.lru_cache(maxsize=64)
+def cached_response_function(params: nm.ModelParams, variable='w_y', backend='numeric'):
+    """
+    dimer_model_numeric.response_NR (variable='w_y') or _PT (variable='gam_y'), built once per parameter set.
+    """
+    return RESPONSE_GETTERS[variable](params, backend=backend)
+
+
+def __remember(key, result, max_bytes):
+    global __memory_bytes
+    if key in __memory:
+        __memory_bytes -= __memory.pop(key).nbytes
+    if result.nbytes > max_bytes:
+        return
+    __memory[key] = result
+    __memory_bytes += result.nbytes
+    while __memory_bytes > max_bytes:
+        _, evicted = __memory.popitem(last=False)
+        __memory_bytes -= evicted.nbytes
+
+
+def __disk_path(key, cache_dir):
+    return os.path.join(cache_dir, hashlib.sha1(repr(key).encode()).hexdigest() + grid_cache.CACHE_SUFFIX)
+
+
+def __load(path):
+    try:
+        with np.load(path, allow_pickle=False) as cached:
+            result = cached['result']
+    except (OSError, KeyError, ValueError):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return result
+
+
+def __store(path, result, cache_dir, disk_max_bytes):
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a private temporary file first so readers never see a half-written entry
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, result=result)
+    os.replace(tmp_path, path)
+    grid_cache.evict(disk_max_bytes, cache_dir)
+
+
+def cached_photon_numbers(params: nm.ModelParams, variable, row_vals, w_f_vals, reducer=None, backend='numeric',
+                          cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, disk_max_bytes=DEFAULT_DISK_MAX_BYTES):
+    """
+    evaluate_photon_numbers(cached_response_function(params, variable, backend), row_vals, w_f_vals, reducer),
+    computed once per key. The returned array is shared with the cache and therefore read-only.
+    """
+    if not isinstance(reducer, (str, type(None))):
+        raise ValueError('Only the named reducers of evaluate_photon_numbers can be cached')
+    key = (__code_version(), params, variable, grid_spec(row_vals), grid_spec(w_f_vals), reducer, backend)
+
+    if key in __memory:
+        __memory.move_to_end(key)
+        return __memory[key]
+
+    path = __disk_path(key, cache_dir) if cache_dir is not None else None
+    result = __load(path) if path is not None else None
+    if result is None:
+        response = cached_response_function(params, variable, backend)
+        result = nm.evaluate_photon_numbers(response, row_vals, w_f_vals, reducer=reducer)
+        if path is not None:
+            __store(path, result, cache_dir, disk_max_bytes)
+
+    result.setflags(write=False)
+    __remember(key, result, max_bytes)
+    return result
+
+
+def clear(cache_dir=None):
+    """
+    Empties the in-process tier, and the disk tier in cache_dir if given.
+    """
+    global __memory_bytes
+    __memory.clear()
+    __memory_bytes = 0
+    cached_response_function.cache_clear()
+    if cache_dir is not None:
+        grid_cache.clear(cache_dir)
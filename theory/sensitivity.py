@@ -0,0 +1,125 @@
+"""
+Closed-form sensitivity of the two-cavity response, the theory side of figure 3's |dS21/dB|.
+
+The response is R = r^T M^-1 F with the dynamics matrix M of theory.dimer_model_numeric. For any
+parameter theta, dR/dtheta = -y^T (dM/dtheta) x with x = M^-1 F and y = M^-T r, and only one or two
+entries of M depend on each parameter:
+
+    w_y (= w_c2):      dM22 = -i
+    gam_y (= gamma_2): dM22 = -1/2
+    J:                 dM12 = i e^{i phi}, dM21 = i
+
+so d|R|^2/dtheta = 2 Re(conj(R) dR/dtheta) is exact and elementwise over any broadcast grid, with no
+finite differences. The w_y derivative is the field derivative up to the constant dw_y/dB.
+
+    dP = photon_number_derivative(params, lo_freqs[None, :], 'w_y', w_y=yig_freqs[:, None])
+    max_dP, at = max_sensitivity_per_frequency(params, yig_freqs, lo_freqs, 'w_y', db=True)
+
+    python -m theory.sensitivity
+"""
+import numpy as np
+
+from theory.dimer_model_numeric import DEFAULT_SWEEP_MAX_BYTES, SWEEP_BYTES_PER_POINT, ModelParams
+
+SENSITIVITY_VARIABLES = ('w_y', 'gam_y', 'J')
+
+# d(10 log10 P) = DB_PER_NEPER * dP / P
+DB_PER_NEPER = 10 / np.log(10)
+
+
+def __matrix_elements(params, w_f, overrides):
+    w_f = np.asarray(w_f)
+    phi = np.asarray(overrides.get('phi', params.phi_val))
+    J = np.asarray(overrides.get('J', params.J_val))
+    m11 = -params.gamma_vec[0] / 2 - 1j * (overrides.get('cavity_freq', params.cavity_freq) - w_f)
+    m12 = 1j * np.exp(1j * phi) * J
+    m21 = 1j * J
+    m22 = (-np.asarray(overrides.get('gam_y', params.gamma_vec[1])) / 2
+           - 1j * (overrides.get('w_y', params.w_y) - w_f))
+    return m11, m12, m21, m22, phi
+
+
+def response_derivative(params: ModelParams, w_f, variable='w_y', **overrides):
+    """
+    Returns (R, dR/d variable) at w_f, with any of w_y, gam_y, J, phi, cavity_freq given as arrays in
+    overrides as in dimer_model_numeric.response; everything broadcasts.
+    """
+    if variable not in SENSITIVITY_VARIABLES:
+        raise ValueError(f'variable must be one of {SENSITIVITY_VARIABLES}')
+    m11, m12, m21, m22, phi = __matrix_elements(params, w_f, overrides)
+    F1, F2 = params.drive_vector
+    r1, r2 = params.readout_vector
+    det = m11 * m22 - m12 * m21
+
+    # x = M^-1 F and y = M^-T r
+    x1, x2 = (m22 * F1 - m12 * F2) / det, (m11 * F2 - m21 * F1) / det
+    y1, y2 = (m22 * r1 - m21 * r2) / det, (m11 * r2 - m12 * r1) / det
+    response = r1 * x1 + r2 * x2
+
+    if variable == 'w_y':
+        derivative = 1j * y2 * x2
+    elif variable == 'gam_y':
+        derivative = y2 * x2 / 2
+    else:
+        derivative = -1j * (np.exp(1j * phi) * y1 * x2 + y2 * x1)
+    return response, derivative
+
+
+def photon_number_derivative(params: ModelParams, w_f, variable='w_y', db=False, **overrides):
+    """
+    d|R|^2 / d variable, or with db=True the derivative of 10 log10 |R|^2 as in the measured dB/V maps.
+    """
+    response, derivative = response_derivative(params, w_f, variable, **overrides)
+    d_photon_numbers = 2 * np.real(np.conj(response) * derivative)
+    if db:
+        return DB_PER_NEPER * d_photon_numbers / np.abs(response) ** 2
+    return d_photon_numbers
+
+
+def max_sensitivity_per_frequency(params: ModelParams, values, w_f_vals, variable='w_y', db=False,
+                                  max_bytes=DEFAULT_SWEEP_MAX_BYTES, **overrides):
+    """
+    For every readout frequency, the largest |derivative| over the sweep of variable through values, as
+    frame_all_derivatives takes over the voltage trace of each frequency. Evaluated in blocks of whole
+    columns under max_bytes. Returns (max |derivative|, the value of variable where it occurs).
+    """
+    values = np.asarray(values, dtype=float)
+    w_f_vals = np.asarray(w_f_vals, dtype=float)
+    columns_per_block = max(int(max_bytes // (SWEEP_BYTES_PER_POINT * max(values.size, 1))), 1)
+
+    max_derivative = np.empty(w_f_vals.size)
+    location = np.empty(w_f_vals.size)
+    for start in range(0, w_f_vals.size, columns_per_block):
+        block = np.abs(photon_number_derivative(params, w_f_vals[None, start:start + columns_per_block], variable,
+                                                db, **{**overrides, variable: values[:, None]}))
+        best = block.argmax(axis=0)
+        max_derivative[start:start + columns_per_block] = block[best, np.arange(block.shape[1])]
+        location[start:start + columns_per_block] = values[best]
+    return max_derivative, location
+
+
+# Checks the closed form against central differences of the response on the figure 2 parameter sets
+if __name__ == "__main__":
+    from theory import dimer_model_numeric as nm
+
+    lo_freqs = np.linspace(5.6, 6.4, 401)
+    nr = ModelParams(J_val=0.06, g_val=0.025 - 0.04, cavity_freq=6.0, w_y=6.0, gamma_vec=np.array([0.025, 0.025]),
+                     drive_vector=np.array([1, 1]), readout_vector=np.array([1, 1]), phi_val=np.pi)
+    pt = ModelParams(J_val=0.075, g_val=0.025 - 0.04, cavity_freq=6.0, w_y=6.0, gamma_vec=np.array([0.04, 0.04]),
+                     drive_vector=np.array([1, 0]), readout_vector=np.array([1, 0]), phi_val=0)
+    for name, params, sweep_name, sweep in [('NR', nr, 'w_y', np.linspace(5.6, 5.9, 301)),
+                                            ('PT', pt, 'gam_y', np.linspace(0.15, 0.3, 301))]:
+        for variable in SENSITIVITY_VARIABLES:
+            grid = {sweep_name: sweep[:, None]}
+            defaults = {'w_y': params.w_y, 'gam_y': params.gamma_vec[1], 'J': params.J_val}
+            center = grid.get(variable, defaults[variable])
+            step = 1e-7
+            upper = np.abs(nm.response(params, lo_freqs, **{**grid, variable: center + step})) ** 2
+            lower = np.abs(nm.response(params, lo_freqs, **{**grid, variable: center - step})) ** 2
+            finite_difference = (upper - lower) / (2 * step)
+            exact = photon_number_derivative(params, lo_freqs, variable, **grid)
+            rel_error = np.max(np.abs(exact - finite_difference)) / np.max(np.abs(exact))
+            print(f'{name} d|R|^2/d{variable}: max error relative to the peak {rel_error:.1e}')
+        max_derivative, location = max_sensitivity_per_frequency(params, sweep, lo_freqs, sweep_name, db=True)
+        print(f'{name}: largest |dP/d{sweep_name}| {max_derivative.max():.3g} dB per unit at '
+              f'{sweep_name} = {location[max_derivative.argmax()]:.4f}, readout {lo_freqs[max_derivative.argmax()]:.4f}')